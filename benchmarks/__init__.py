@@ -0,0 +1 @@
+# Suite de benchmarks reproducibles (python -m benchmarks.run --help)
@@ -0,0 +1,165 @@
+"""Benchmarks de las etapas del mapa sobre libros EEMM sintéticos.
+
+Uso:
+    python -m benchmarks.run --rows 1000 10000 100000 --promos 200 2000
+    python -m benchmarks.run --compare benchmarks/results/A.json benchmarks/results/B.json
+
+Cada ejecución guarda un JSON (una fila por etapa y tamaño) que se puede comparar con
+el de otro commit mediante --compare.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_workbook
+from eemm import fichas
+from eemm.aggregate import aggregate_promotions
+from eemm.facets import encode_facets
+from eemm.ingest import load_workbook, parse_workbook
+from eemm.mapview import MarkerDataLayer
+from eemm.markers import build_smart_marker_html, marker_records
+from eemm.placement import place_markers
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def _timeit(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return result, {'min_s': min(times), 'median_s': statistics.median(times), 'repeat': repeat}
+
+
+def _half_selection(facets, facet):
+    opts = facets.options(facet)
+    return opts[: max(1, len(opts) // 2)]
+
+
+def bench_case(rows, promos, spread, seed, repeat, n_fichas):
+    data = synthetic_workbook(rows, promos, spread, seed)
+    case = {'rows': rows, 'promos': promos, 'spread': spread, 'xlsx_bytes': len(data)}
+    out = []
+
+    def record(stage, stats, **extra):
+        out.append(dict(case, stage=stage, **stats, **extra))
+
+    (df, cols), stats = _timeit(lambda: parse_workbook(data), 1 if rows >= 100000 else repeat)
+    record('ingest_parse', stats, rows_out=len(df))
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        load_workbook(data, cache_dir=cache_dir)
+        _, stats = _timeit(lambda: load_workbook(data, cache_dir=cache_dir), repeat)
+        record('ingest_cached', stats)
+
+    (df, facets), stats = _timeit(lambda: encode_facets(df, cols), repeat)
+    record('facet_encode', stats, frame_bytes=int(df.memory_usage(deep=True).sum()))
+
+    selection = {f: _half_selection(facets, f) for f in ('tier', 'dorm') if f in facets}
+    mask, stats = _timeit(lambda: facets.mask(selection), repeat)
+    record('filter_mask', stats, rows_selected=int(mask.sum()))
+    df_filtered = df[mask]
+
+    df_promo, stats = _timeit(lambda: aggregate_promotions(df_filtered, cols), repeat)
+    record('aggregate', stats, promos_out=len(df_promo))
+
+    placement, stats = _timeit(lambda: place_markers(df_promo), repeat)
+    record('placement', stats, markers=len(placement))
+
+    refs = df_promo[cols['ref']].astype(str).tolist()
+    vrms = df_promo[cols['vrm']].tolist()
+    html, stats = _timeit(lambda: [build_smart_marker_html(r, v, d, True) for r, v, d in zip(refs, vrms, placement['dir'])], repeat)
+    record('marker_html', stats, payload_bytes=sum(len(h.encode('utf-8')) for h in html))
+
+    layer, stats = _timeit(lambda: MarkerDataLayer(marker_records(refs, placement['lat'], placement['lon'], vrms, placement['dir'])), repeat)
+    record('marker_data_layer', stats, payload_bytes=len(layer.data_json.encode('utf-8')))
+
+    if n_fichas and fichas.MATPLOTLIB_INSTALLED:
+        subset = df_promo.head(n_fichas)
+
+        def cold():
+            fichas.clear_cache()
+            return fichas.generate_zip_images(subset, cols)
+        buf, stats = _timeit(cold, 1)
+        record('fichas_zip_cold', stats, fichas=len(subset), zip_bytes=len(buf.getvalue()))
+        _, stats = _timeit(lambda: fichas.generate_zip_images(subset, cols), repeat)
+        record('fichas_zip_cached', stats, fichas=len(subset))
+
+    return out
+
+
+def run(args):
+    results = []
+    for rows in args.rows:
+        for promos in args.promos:
+            print(f"· rows={rows} promos={promos}", flush=True)
+            for r in bench_case(rows, promos, args.spread, args.seed, args.repeat, args.fichas):
+                print(f"    {r['stage']:<20} {r['median_s'] * 1000:10.2f} ms")
+                results.append(r)
+
+    report = {
+        'commit': _git_commit(),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'numpy': np.__version__,
+        'seed': args.seed,
+        'results': results,
+    }
+    path = args.output or os.path.join(RESULTS_DIR, f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=1, ensure_ascii=False)
+    print(f"Resultados en {path}")
+
+
+def compare(path_a, path_b):
+    with open(path_a, encoding='utf-8') as fh: a = json.load(fh)
+    with open(path_b, encoding='utf-8') as fh: b = json.load(fh)
+    key = lambda r: (r['stage'], r['rows'], r['promos'], r['spread'])
+    base = {key(r): r for r in a['results']}
+    print(f"{'etapa':<20} {'rows':>8} {'promos':>7} {a['commit']:>10} {b['commit']:>10} {'ratio':>7}")
+    for r in b['results']:
+        old = base.get(key(r))
+        if old is None:
+            continue
+        ratio = r['median_s'] / old['median_s'] if old['median_s'] else float('nan')
+        print(f"{r['stage']:<20} {r['rows']:>8} {r['promos']:>7} {old['median_s'] * 1000:>8.1f}ms {r['median_s'] * 1000:>8.1f}ms {ratio:>6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--promos', type=int, nargs='+', default=[200])
+    parser.add_argument('--spread', type=float, default=0.05, help="lado del área en grados (densidad espacial)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--fichas', type=int, default=20, help="fichas PNG a renderizar por caso (0 = omitir)")
+    parser.add_argument('-o', '--output', help="ruta del JSON de resultados")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NUEVO'))
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
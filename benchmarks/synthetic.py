@@ -0,0 +1,87 @@
+"""Generador de libros EEMM sintéticos para benchmarks.
+
+Uso:
+    python -m benchmarks.synthetic --rows 100000 --promos 2000 --spread 0.05 -o eemm_100k.xlsx
+"""
+import argparse
+import io
+
+import numpy as np
+import pandas as pd
+
+CENTER = (40.4168, -3.7038)   # Madrid
+TIPOLOGIAS = ['PLURIFAMILIAR', 'UNIFAMILIAR', 'ÁTICO', 'DÚPLEX']
+TIERS = ['TIER 1', 'TIER 2', 'TIER 3']
+CIUDADES = ['MADRID', 'ALCOBENDAS', 'GETAFE', 'POZUELO', 'LEGANÉS']
+PLANTAS = ['BJ', 1, 2, 3, 4, 5, 6, 'AT']
+DORMS = [1, 2, 3, 4, '5D']
+
+
+def synthetic_frame(rows, promos, spread=0.05, seed=0, missing_coord=0.01):
+    """DataFrame con el formato de la hoja EEMM.
+
+    ``spread`` es el lado (en grados) del recuadro donde se reparten las promociones:
+    con el mismo número de promociones, menos spread = más densidad espacial.
+    """
+    rng = np.random.default_rng(seed)
+    promos = max(1, min(promos, rows))
+
+    p_lat = CENTER[0] + (rng.random(promos) - 0.5) * spread
+    p_lon = CENTER[1] + (rng.random(promos) - 0.5) * spread
+    p_vrm = rng.normal(3500, 900, promos).clip(900)
+    p_zona = rng.integers(1, 13, promos)
+    p_tier = rng.integers(0, len(TIERS), promos)
+    p_ciudad = rng.integers(0, len(CIUDADES), promos)
+
+    # Unidades por promoción con cola larga, como en los estudios reales
+    weights = rng.pareto(1.5, promos) + 1
+    promo = rng.choice(promos, size=rows, p=weights / weights.sum())
+    promo[:promos] = np.arange(promos)   # toda promoción tiene al menos una unidad
+
+    sup = rng.normal(85, 25, rows).clip(35)
+    vrm = p_vrm[promo] * rng.normal(1, 0.08, rows)
+    coord = np.char.add(np.char.add(np.round(p_lat[promo], 6).astype(str), ', '), np.round(p_lon[promo], 6).astype(str))
+    coord = coord.astype(object)
+    coord[rng.random(rows) < missing_coord] = None
+
+    return pd.DataFrame({
+        'REF': promo + 1,
+        'PROMOCIÓN': np.char.add('Residencial ', (promo + 1).astype(str)),
+        'COORD': coord,
+        'DIRECCIÓN': np.char.add('Calle Sintética ', (promo % 400 + 1).astype(str)),
+        'CIUDAD': np.array(CIUDADES, dtype=object)[p_ciudad[promo]],
+        'ZONA': np.char.add('Z', p_zona[promo].astype(str)),
+        'TIER': np.array(TIERS, dtype=object)[p_tier[promo]],
+        'TIPOLOGIA': rng.choice(np.array(TIPOLOGIAS, dtype=object), rows),
+        'PLANTA': rng.choice(np.array(PLANTAS, dtype=object), rows),
+        'Nº DORM': rng.choice(np.array(DORMS, dtype=object), rows, p=[0.15, 0.35, 0.3, 0.15, 0.05]),
+        'SUP. ÚTIL': sup.round(1),
+        'VRM SCIC': vrm.round(0),
+        'PVP': (vrm * sup).round(-2),
+        'ESTADO': rng.choice(np.array(['DISPONIBLE', 'RESERVADO', 'VENDIDO'], dtype=object), rows),
+    })
+
+
+def synthetic_workbook(rows, promos, spread=0.05, seed=0, missing_coord=0.01):
+    """Bytes de un .xlsx con la hoja EEMM sintética (más una hoja extra, como los reales)."""
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine='openpyxl') as writer:
+        pd.DataFrame({'NOTAS': ['Estudio sintético']}).to_excel(writer, sheet_name='PORTADA', index=False)
+        synthetic_frame(rows, promos, spread, seed, missing_coord).to_excel(writer, sheet_name='EEMM', index=False)
+    return buf.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--promos', type=int, default=500)
+    parser.add_argument('--spread', type=float, default=0.05, help="lado del área en grados (densidad espacial)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', required=True)
+    args = parser.parse_args(argv)
+    with open(args.output, 'wb') as fh:
+        fh.write(synthetic_workbook(args.rows, args.promos, args.spread, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+# Núcleo de cálculo del Estudio de Mercado (independiente de Streamlit).
+# Los submódulos se importan bajo demanda: ``import eemm`` no carga pandas, folium
+# ni matplotlib hasta que se usa algo que los necesita.
+import importlib
+
+_EXPORTS = {
+    'aggregate_promotions': 'aggregate', 'normalize_dorm': 'aggregate',
+    'GeoIndex': 'comparables', 'haversine_m': 'comparables', 'query_comparables': 'comparables',
+    'PricingCube': 'cube',
+    'FACETS': 'facets', 'FacetIndex': 'facets', 'encode_facets': 'facets', 'mask_digest': 'facets',
+    'MATPLOTLIB_INSTALLED': 'fichas', 'generate_zip_images': 'fichas', 'render_ficha': 'fichas',
+    'write_pdf': 'fichas', 'write_zip': 'fichas',
+    'GeocodeCache': 'geocode', 'GoogleMapsGeocoder': 'geocode', 'StubGeocoder': 'geocode',
+    'default_geocoder': 'geocode', 'fill_missing_coords': 'geocode', 'geocode_addresses': 'geocode',
+    'compact_frame': 'ingest', 'load_dataset': 'ingest', 'load_workbook': 'ingest', 'parse_coords': 'ingest',
+    'resolve_columns': 'ingest',
+    'run_batch': 'batch',
+    'RerunProfiler': 'instrument', 'RunTimer': 'instrument', 'deferred_records': 'instrument', 'profiled': 'instrument',
+    'MarkerDataLayer': 'mapview', 'PyramidLayer': 'mapview', 'build_map': 'mapview',
+    'build_smart_marker_html': 'markers', 'frame_marker_records': 'markers', 'marker_records': 'markers',
+    'DatasetStore': 'store', 'get_store': 'store',
+    'GridPyramid': 'pyramid', 'ZOOM_BANDS': 'pyramid', 'pyramid_levels': 'pyramid',
+    'tile_layers': 'tiles',
+    'CLUSTER_THRESHOLD': 'placement', 'OFFSET_STEP': 'placement', 'place_labels': 'placement', 'place_markers': 'placement',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'eemm' has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
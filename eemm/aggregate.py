@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+# --- AGREGACIÓN POR PROMOCIÓN ---
+# Un único groupby calcula lat/lon, mediana VRM, media PVP y unidades. El conjunto de
+# dormitorios se normaliza por categoría (no por fila) y se combina por grupo como una
+# máscara de bits, sin funciones Python por grupo.
+
+
+def normalize_dorm(value):
+    s = str(value).replace('.0', '').strip().upper()
+    if s and not s.endswith('D'): s += 'D'
+    return s
+
+
+def _dorm_sets(values, group_codes, n_groups):
+    """Texto '1D-2D-3D' por grupo a partir de los valores de dormitorios de cada fila."""
+    cat = values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype('category')
+    labels = [normalize_dorm(v) for v in cat.cat.categories]
+    tokens = sorted({t for t in labels if t})
+    empty = np.array([""] * n_groups, dtype=object)
+    if not tokens:
+        return empty
+
+    token_pos = {t: i for i, t in enumerate(tokens)}
+    # código de categoría -> índice de token (-1 = vacío); la posición 0 representa NaN
+    cat_to_token = np.array([-1] + [token_pos.get(t, -1) for t in labels], dtype=np.int64)
+    row_tokens = cat_to_token[cat.cat.codes.to_numpy().astype(np.int64) + 1]
+    valid = (row_tokens >= 0) & (group_codes >= 0)
+
+    if len(tokens) > 64:
+        pairs = pd.DataFrame({'g': group_codes[valid], 't': row_tokens[valid]}).drop_duplicates().sort_values(['g', 't'])
+        joined = pairs.groupby('g')['t'].agg(lambda ts: "-".join(tokens[t] for t in ts))
+        empty[joined.index.to_numpy()] = joined.to_numpy()
+        return empty
+
+    bits = np.zeros(n_groups, dtype=np.uint64)
+    np.bitwise_or.at(bits, group_codes[valid], np.left_shift(np.uint64(1), row_tokens[valid].astype(np.uint64)))
+    uniq, inverse = np.unique(bits, return_inverse=True)
+    names = np.array(["-".join(t for i, t in enumerate(tokens) if (int(b) >> i) & 1) for b in uniq], dtype=object)
+    return names[inverse]
+
+
+def aggregate_promotions(df, cols):
+    """Una fila por promoción (REF) con lat, lon, VRM mediano, PVP medio, nombre, tipologías y UDS."""
+    ref = cols['ref']
+    grouped = df.groupby(ref, sort=True, observed=True)
+
+    named = {'lat': ('lat', 'first'), 'lon': ('lon', 'first')}
+    if cols['vrm'] in df.columns: named[cols['vrm']] = (cols['vrm'], 'median')
+    if cols['pvp'] in df.columns: named[cols['pvp']] = (cols['pvp'], 'mean')
+    if cols['nombre'] and cols['nombre'] != ref and cols['nombre'] in df.columns:
+        named[cols['nombre']] = (cols['nombre'], 'first')
+    named['UDS'] = ('lat', 'size')
+
+    df_promo = grouped.agg(**named)
+    if cols['dorm'] and cols['dorm'] in df.columns:
+        # Filas con REF vacío: ngroup() da NaN (float) y el groupby no las agrega -> código -1
+        codes = grouped.ngroup().fillna(-1).astype(np.int64).to_numpy()
+        df_promo.insert(len(df_promo.columns) - 1, cols['dorm'], _dorm_sets(df[cols['dorm']], codes, len(df_promo)))
+    return df_promo.reset_index()
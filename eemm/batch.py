@@ -0,0 +1,212 @@
+"""Generación por lotes de mapas y fichas, sin Streamlit.
+
+Uso:
+    python -m eemm.batch estudios/ salida/ --presets presets.json --workers 4
+
+Por cada libro .xlsx de la carpeta de entrada y cada preset de filtros escribe
+``salida/<estudio>/<preset>/mapa.html`` y ``fichas.zip`` (y ``fichas.pdf`` con
+--pdf). El fichero de presets es un JSON como
+``{"nombre": {"tier": ["TIER 1"], "zona": ["Z1", "Z2"], "ocultos": ["12"]}}``
+con las mismas facetas que los filtros de la app (tipo, tier, zona, ciudad, planta,
+dorm); una faceta ausente no filtra. Los valores se comparan como texto (``[2, 3]``
+equivale a ``["2", "3"]`` o ``["2.0", "3.0"]`` según el libro) y una clave
+desconocida es un error.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+DEFAULT_PRESETS = {'todo': {}}
+
+
+def _slug(name):
+    return re.sub(r'[^\w.-]+', '_', str(name)).strip('_') or 'sin_nombre'
+
+
+def validate_presets(presets):
+    """Comprueba la forma de los presets; ValueError con el primer problema encontrado."""
+    from .facets import FACETS
+
+    valid = FACETS + ('ocultos',)
+    if not isinstance(presets, dict):
+        raise ValueError("el JSON de presets debe ser un objeto {nombre: {faceta: [valores]}}")
+    for name, preset in presets.items():
+        if not isinstance(preset, dict):
+            raise ValueError(f"preset '{name}': debe ser un objeto {{faceta: [valores]}}")
+        for key, values in preset.items():
+            if key not in valid:
+                raise ValueError(f"preset '{name}': clave desconocida '{key}' (válidas: {', '.join(valid)})")
+            if not isinstance(values, list):
+                raise ValueError(f"preset '{name}': '{key}' debe ser una lista de valores")
+
+
+def _as_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def preset_labels(values, categories):
+    """Valores del preset -> categorías de la faceta (texto; 2 casa con '2' y con '2.0')."""
+    labels = []
+    for value in values:
+        label = str(value)
+        if label not in categories and _as_number(value) is not None:
+            label = next((c for c in categories if _as_number(c) == _as_number(value)), label)
+        labels.append(label)
+    return labels
+
+
+def apply_preset(df, cols, facets, preset):
+    """Filtra, agrega por promoción y quita las promociones ocultas del preset."""
+    from .aggregate import aggregate_promotions
+
+    # Las categorías de faceta son texto: {"dorm": [2, 3]} debe seleccionar '2' y '3'
+    selection = {f: preset_labels(v, facets.categories[f]) for f, v in preset.items() if f != 'ocultos' and f in facets}
+    df_filtered = df[facets.mask(selection)]
+    if df_filtered.empty:
+        return df_filtered
+    df_promo = aggregate_promotions(df_filtered, cols)
+    hidden = {str(r) for r in preset.get('ocultos', [])}
+    return df_promo[~df_promo[cols['ref']].astype(str).isin(hidden)]
+
+
+def process_workbook(path, out_dir, presets, options):
+    """Procesa un libro con todos los presets; pensado para ejecutarse en un proceso del pool."""
+    from .fichas import MATPLOTLIB_INSTALLED, write_pdf, write_zip
+    from .geocode import MAX_QPS, default_geocoder
+    from .ingest import load_dataset
+    from .mapview import build_map
+
+    study = _slug(os.path.splitext(os.path.basename(path))[0])
+    results = []
+    t0 = time.perf_counter()
+    with open(path, 'rb') as fh:
+        geocoder = default_geocoder(options.get('geocode_qps', MAX_QPS)) if options.get('geocodificar', True) else None
+        df, cols, facets = load_dataset(fh.read(), options.get('cache_dir'), geocoder)
+    if df.empty:
+        return [{'estudio': study, 'preset': None, 'ok': False, 'error': "sin hoja EEMM o sin columnas COORD ni DIRECCIÓN"}]
+
+    for preset_name, preset in presets.items():
+        df_visible = apply_preset(df, cols, facets, preset)
+        if df_visible.empty:
+            # Un preset que no selecciona nada suele ser un valor mal escrito: no se escribe un mapa vacío
+            results.append({'estudio': study, 'preset': preset_name, 'ok': True, 'promociones': 0, 'fichas': 0,
+                            'aviso': "el preset no selecciona ninguna promoción"})
+            continue
+        target = os.path.join(out_dir, study, _slug(preset_name))
+        os.makedirs(target, exist_ok=True)
+
+        m = build_map(df_visible, cols, show_price=options.get('precios', True), tipo_vista=options.get('vista', "Callejero"),
+                      estilo_mapa=options.get('estilo', "Estándar"), light=options.get('capa_ligera', True))
+        m.save(os.path.join(target, 'mapa.html'))
+
+        fichas = 0
+        if options.get('fichas', True) and MATPLOTLIB_INSTALLED and not df_visible.empty:
+            write_zip(df_visible, cols, os.path.join(target, 'fichas.zip'), max_workers=options.get('fichas_workers'))
+            fichas = len(df_visible)
+            if options.get('pdf'):
+                write_pdf(df_visible, cols, os.path.join(target, 'fichas.pdf'), title=f"{study} · {preset_name}")
+
+        results.append({'estudio': study, 'preset': preset_name, 'ok': True, 'promociones': len(df_visible),
+                        'fichas': fichas, 'salida': target})
+    for r in results:
+        r['segundos'] = round(time.perf_counter() - t0, 2)
+    return results
+
+
+def run_batch(paths, out_dir, presets=None, workers=None, **options):
+    """Procesa varios libros en un pool de procesos y devuelve la lista de resultados."""
+    presets = presets or DEFAULT_PRESETS
+    validate_presets(presets)
+    results = []
+    if workers == 1 or len(paths) <= 1:
+        # En el proceso principal las fichas de cada libro se reparten en el pool de iter_fichas
+        options = dict(options, fichas_workers=workers)
+        for path in paths:
+            results.extend(_safe_process(path, out_dir, presets, options))
+        return results
+
+    from .geocode import MAX_QPS
+
+    # Dentro de un worker las fichas se pintan en serie: el paralelismo ya está en el pool de
+    # libros. El limitador de geocodificación es por proceso: cada worker recibe su parte
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    options = dict(options, fichas_workers=1, geocode_qps=MAX_QPS / workers)
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = {pool.submit(_safe_process, p, out_dir, presets, options): p for p in paths}
+        for fut in as_completed(futures):
+            results.extend(fut.result())
+    return results
+
+
+def _safe_process(path, out_dir, presets, options):
+    try:
+        return process_workbook(path, out_dir, presets, options)
+    except Exception as e:
+        return [{'estudio': os.path.basename(path), 'preset': None, 'ok': False, 'error': f"{e}",
+                 'traceback': traceback.format_exc()}]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m eemm.batch', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('entrada', help="carpeta con libros .xlsx (o un único .xlsx)")
+    parser.add_argument('salida', help="carpeta de salida")
+    parser.add_argument('--presets', help="JSON con presets de filtros (por defecto, sin filtros)")
+    parser.add_argument('--workers', type=int, default=None, help="procesos en paralelo (por defecto, nº de núcleos)")
+    parser.add_argument('--sin-precios', action='store_true', help="etiquetas sin €/m²")
+    parser.add_argument('--vista', choices=["Callejero", "Satélite"], default="Callejero")
+    parser.add_argument('--estilo', choices=["Estándar", "Escala de Grises", "Azul Oscuro"], default="Estándar")
+    parser.add_argument('--marcadores-html', action='store_true', help="un folium.Marker con HTML por promoción en vez de la capa ligera")
+    parser.add_argument('--sin-fichas', action='store_true', help="no generar fichas.zip")
+    parser.add_argument('--pdf', action='store_true', help="generar también fichas.pdf (una ficha por página)")
+    parser.add_argument('--cache-dir', help="carpeta de la caché columnar de ingesta")
+    parser.add_argument('--sin-geocodificar', action='store_true',
+                        help="descartar las filas sin COORD en vez de geocodificarlas (EEMM_GEOCODER / GOOGLE_MAPS_API_KEY)")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.entrada):
+        paths = sorted(p for p in glob.glob(os.path.join(args.entrada, '*.xlsx')) if not os.path.basename(p).startswith('~$'))
+    else:
+        paths = [args.entrada]
+    if not paths:
+        parser.error(f"no hay libros .xlsx en {args.entrada}")
+
+    presets = DEFAULT_PRESETS
+    if args.presets:
+        with open(args.presets, encoding='utf-8') as fh:
+            presets = json.load(fh)
+    try:
+        validate_presets(presets)
+    except ValueError as e:
+        parser.error(f"{args.presets}: {e}")
+
+    t0 = time.perf_counter()
+    results = run_batch(paths, args.salida, presets, args.workers, precios=not args.sin_precios, vista=args.vista,
+                        estilo=args.estilo, capa_ligera=not args.marcadores_html, fichas=not args.sin_fichas, pdf=args.pdf,
+                        cache_dir=args.cache_dir, geocodificar=not args.sin_geocodificar)
+    failed = [r for r in results if not r['ok']]
+    for r in results:
+        if r.get('aviso'):
+            print(f"AVISO {r['estudio']} / {r['preset']}: {r['aviso']}", file=sys.stderr)
+        elif r['ok']:
+            print(f"OK    {r['estudio']} / {r['preset']}: {r['promociones']} promociones, {r['fichas']} fichas")
+        else:
+            print(f"ERROR {r['estudio']}: {r['error']}", file=sys.stderr)
+    written = sum(r['ok'] and not r.get('aviso') for r in results)
+    print(f"{len(paths)} libros, {written} salidas en {time.perf_counter() - t0:.1f} s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
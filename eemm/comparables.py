@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+# --- BÚSQUEDA DE COMPARABLES (RADIO / K MÁS CERCANOS) ---
+# Índice espacial de promociones construido una vez por dataset: puntos ordenados por
+# celda de una rejilla lat/lon, de modo que cada fila de celdas de una consulta es un
+# tramo contiguo (dos searchsorted). Las distancias son haversine en metros, no la
+# distancia euclídea en grados que usa la colocación de etiquetas.
+
+EARTH_RADIUS_M = 6_371_008.8
+CELL_DEG = 0.01            # ~1,1 km de latitud por celda
+_ROW_STRIDE = 1 << 32      # clave de celda = fila * _ROW_STRIDE + columna
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def parse_point(text):
+    """'40.4168, -3.7038' -> (40.4168, -3.7038); None si no es una coordenada válida."""
+    try:
+        lat, lon = (float(p) for p in str(text).replace(' ', '').split(','))
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+class GeoIndex:
+    def __init__(self, refs, lat, lon, cell_deg=CELL_DEG):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        rows = np.floor(lat / cell_deg).astype(np.int64)
+        cols = np.floor(lon / cell_deg).astype(np.int64)
+        keys = rows * _ROW_STRIDE + cols
+        order = np.argsort(keys, kind='stable')
+
+        self.cell_deg = cell_deg
+        self.keys = keys[order]
+        self.refs = np.asarray([str(r) for r in refs], dtype=object)[order]
+        self.lat = lat[order]
+        self.lon = lon[order]
+        self._pos = {r: i for i, r in enumerate(self.refs)}
+
+    @classmethod
+    def from_frame(cls, df, cols, cell_deg=CELL_DEG):
+        """Un punto por promoción (primera coordenada de cada REF)."""
+        pts = df.groupby(cols['ref'], sort=False, observed=True)[['lat', 'lon']].first()
+        return cls(pts.index, pts['lat'].to_numpy(), pts['lon'].to_numpy(), cell_deg)
+
+    def __len__(self):
+        return len(self.refs)
+
+    def locate(self, ref):
+        i = self._pos.get(str(ref))
+        if i is None:
+            raise KeyError(f"REF {ref} no está en el índice")
+        return float(self.lat[i]), float(self.lon[i])
+
+    def mask_for(self, refs):
+        """Máscara booleana (en el orden del índice) de las REF permitidas."""
+        return np.isin(self.refs, np.asarray([str(r) for r in refs], dtype=object))
+
+    def _candidates(self, lat, lon, radius_m):
+        dlat = np.degrees(radius_m / EARTH_RADIUS_M)
+        coslat = np.cos(np.radians(min(89.9, abs(lat) + dlat)))
+        dlon = np.degrees(radius_m / (EARTH_RADIUS_M * coslat))
+        if dlon >= 180 or dlat >= 90:
+            return np.arange(len(self.refs))
+        r0, r1 = int(np.floor((lat - dlat) / self.cell_deg)), int(np.floor((lat + dlat) / self.cell_deg))
+        c0, c1 = int(np.floor((lon - dlon) / self.cell_deg)), int(np.floor((lon + dlon) / self.cell_deg))
+        row_keys = np.arange(r0, r1 + 1, dtype=np.int64) * _ROW_STRIDE
+        starts = np.searchsorted(self.keys, row_keys + c0, side='left')
+        ends = np.searchsorted(self.keys, row_keys + c1, side='right')
+        spans = [np.arange(s, e) for s, e in zip(starts, ends) if e > s]
+        return np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+
+    def _result(self, idx, dist):
+        order = np.argsort(dist, kind='stable')
+        return pd.DataFrame({'ref': self.refs[idx][order], 'lat': self.lat[idx][order],
+                             'lon': self.lon[idx][order], 'dist_m': dist[order]})
+
+    def within(self, lat, lon, radius_m, allowed=None):
+        """Promociones a ``radius_m`` metros o menos, ordenadas por distancia."""
+        idx = self._candidates(lat, lon, radius_m)
+        if allowed is not None:
+            idx = idx[allowed[idx]]
+        dist = haversine_m(lat, lon, self.lat[idx], self.lon[idx])
+        keep = dist <= radius_m
+        return self._result(idx[keep], dist[keep])
+
+    def nearest(self, lat, lon, k, allowed=None, exclude=None):
+        """Las ``k`` promociones más cercanas (opcionalmente sólo entre ``allowed``)."""
+        if exclude is not None:
+            allowed = (np.ones(len(self.refs), dtype=bool) if allowed is None else allowed.copy())
+            allowed[self.mask_for(exclude)] = False
+        available = len(self.refs) if allowed is None else int(allowed.sum())
+        k = min(k, available)
+        if k <= 0:
+            return self._result(np.empty(0, dtype=np.int64), np.empty(0))
+        # Radio creciente: con k resultados dentro de r, ninguno de fuera puede estar más cerca
+        radius = self.cell_deg * 111_000
+        while True:
+            found = self.within(lat, lon, radius, allowed)
+            if len(found) >= k or radius > np.pi * EARTH_RADIUS_M:
+                return found.head(k).reset_index(drop=True)
+            radius *= 2
+
+
+def query_comparables(index, ref=None, point=None, k=None, radius_m=None, allowed_refs=None):
+    """Comparables alrededor de una REF o de un punto ``(lat, lon)``.
+
+    Con ``k`` devuelve los k más cercanos (más la propia REF de origen, a distancia 0);
+    con ``radius_m``, todos los que están dentro del radio. ``allowed_refs`` limita la
+    búsqueda, p.ej. a las promociones que pasan los filtros actuales.
+    """
+    if ref is not None:
+        lat, lon = index.locate(ref)
+    elif point is not None:
+        lat, lon = point
+    else:
+        raise ValueError("Indica una REF o un punto (lat, lon)")
+    allowed = index.mask_for(allowed_refs) if allowed_refs is not None else None
+
+    if radius_m is not None:
+        return index.within(lat, lon, radius_m, allowed)
+    if k is None:
+        raise ValueError("Indica k o radius_m")
+    found = index.nearest(lat, lon, k, allowed, exclude=[ref] if ref is not None else None)
+    if ref is not None:
+        subject = pd.DataFrame({'ref': [str(ref)], 'lat': [lat], 'lon': [lon], 'dist_m': [0.0]})
+        found = pd.concat([subject, found], ignore_index=True)
+    return found
@@ -0,0 +1,206 @@
+import numpy as np
+import pandas as pd
+
+# --- CUBO DE PRECIOS (ZONA × TIER × TIPOLOGÍA × PLANTA × DORMITORIOS) ---
+# Se construye una vez por dataset: una celda por combinación de facetas presente, con
+# unidades, suma y nº de valores de VRM SCIC (€/m²) y PVP, y un sketch de cuantiles por
+# medida. El sketch es un histograma de cubetas logarítmicas (estilo DDSketch, error
+# relativo SKETCH_ACCURACY): sumar cubetas fusiona sketches, así que cualquier
+# selección de filtros y cualquier agrupación se resuelve sumando celdas, sin volver a
+# recorrer las filas. Los sketches se guardan dispersos (pares celda-cubeta con
+# unidades, como mucho uno por fila), no como matriz celdas × cubetas. La ciudad también es dimensión para que todos los filtros de la
+# app re-corten el cubo; las promociones ocultas se restan con sus propios sketches.
+
+CUBE_DIMS = ('zona', 'tier', 'tipo', 'planta', 'dorm', 'ciudad')
+MEASURES = ('vrm', 'pvp')
+QUANTILES = (0.10, 0.25, 0.50, 0.75, 0.90)
+SKETCH_ACCURACY = 0.01
+
+
+def _gamma(accuracy):
+    return (1 + accuracy) / (1 - accuracy)
+
+
+class _Measure:
+    """Cubetas de una medida por fila; índice absoluto ceil(log_gamma(x)) desde ``offset``.
+
+    Sketch por celda en formato COO: ``pair_cell``, ``pair_bucket``, ``pair_count``.
+    """
+
+    def __init__(self, values, row_cell, n_cells, gamma):
+        values = np.asarray(values, dtype=float)
+        valid = np.isfinite(values) & (values > 0)
+        idx = np.ceil(np.log(np.where(valid, values, 1.0)) / np.log(gamma)).astype(np.int64)
+        self.offset = int(idx[valid].min()) if valid.any() else 0
+        self.n_buckets = int(idx[valid].max()) - self.offset + 1 if valid.any() else 1
+        self.gamma = gamma
+        # Por fila (para restar promociones ocultas): cubeta relativa, -1 = sin valor
+        self.row_bucket = np.where(valid, idx - self.offset, -1).astype(np.int32)
+        self.row_value = np.where(valid, values, 0.0)
+
+        cells = row_cell[valid]
+        pairs, counts = np.unique(cells.astype(np.int64) * self.n_buckets + self.row_bucket[valid], return_counts=True)
+        self.pair_cell = (pairs // self.n_buckets).astype(np.int32)
+        self.pair_bucket = (pairs % self.n_buckets).astype(np.int32)
+        self.pair_count = counts.astype(np.int32)
+        self.sum = np.bincount(cells, weights=values[valid], minlength=n_cells)
+
+    def bucket_values(self):
+        """Valor representativo de cada cubeta (error relativo <= accuracy)."""
+        i = np.arange(self.offset, self.offset + self.n_buckets, dtype=float)
+        return 2 * self.gamma**i / (self.gamma + 1)
+
+
+def _quantiles(pair_group, pair_bucket, counts, n_groups, values, qs):
+    """Cuantiles por grupo de pares (grupo, cubeta, unidades) ordenados (NaN donde no hay valores)."""
+    n = np.bincount(pair_group, weights=counts, minlength=n_groups).astype(np.int64)
+    # Acumulado global: cada grupo es un tramo contiguo que empieza tras las unidades de los anteriores
+    cum = np.cumsum(counts)
+    start = np.cumsum(n) - n
+    out = np.full((n_groups, len(qs)), np.nan)
+    has = n > 0
+    for j, q in enumerate(qs):
+        rank = np.floor(q * (n[has] - 1)).astype(np.int64)
+        out[has, j] = values[pair_bucket[np.searchsorted(cum, start[has] + rank, side='right')]]
+    return out
+
+
+class PricingCube:
+    def __init__(self, facets, refs, vrm, pvp, accuracy=SKETCH_ACCURACY):
+        self.dims = tuple(d for d in CUBE_DIMS if d in facets)
+        self.categories = {d: facets.categories[d] for d in self.dims}
+        n_rows = len(refs)
+
+        # Clave de celda en base mixta sobre los códigos de faceta (0 = vacío)
+        key = np.zeros(n_rows, dtype=np.int64)
+        mult = {}
+        m = 1
+        for d in self.dims:
+            mult[d] = m
+            key += facets.codes[d].astype(np.int64) * m
+            m *= len(self.categories[d]) + 1
+        cell_keys, row_cell = np.unique(key, return_inverse=True)
+        row_cell = row_cell.reshape(-1)
+        self.n_cells = len(cell_keys)
+        self.cell_codes = {d: ((cell_keys // mult[d]) % (len(self.categories[d]) + 1)).astype(np.int32) for d in self.dims}
+        self.row_cell = row_cell.astype(np.int32)
+        self.uds = np.bincount(row_cell, minlength=self.n_cells)
+
+        gamma = _gamma(accuracy)
+        self.measures = {'vrm': _Measure(vrm, row_cell, self.n_cells, gamma),
+                         'pvp': _Measure(pvp, row_cell, self.n_cells, gamma)}
+        self.ref_rows = pd.Series(np.arange(n_rows)).groupby(pd.Series(refs).astype(str).to_numpy(), sort=False).indices
+
+    @classmethod
+    def from_frame(cls, df, cols, facets, accuracy=SKETCH_ACCURACY):
+        """Cubo del frame cargado (filas = unidades) con su índice de facetas."""
+        def numeric(key):
+            col = cols.get(key)
+            return pd.to_numeric(df[col], errors='coerce').to_numpy() if col in df.columns else np.full(len(df), np.nan)
+        return cls(facets, df[cols['ref']], numeric('vrm'), numeric('pvp'), accuracy)
+
+    def cell_mask(self, selections=None):
+        """Celdas compatibles con la selección de filtros (misma semántica que FacetIndex.mask)."""
+        mask = np.ones(self.n_cells, dtype=bool)
+        for dim, selected in (selections or {}).items():
+            if dim in self.cell_codes and selected is not None:
+                lookup = {v: i + 1 for i, v in enumerate(self.categories[dim])}
+                allowed = np.zeros(len(self.categories[dim]) + 1, dtype=bool)
+                allowed[[lookup[v] for v in selected if v in lookup]] = True
+                mask &= allowed[self.cell_codes[dim]]
+        return mask
+
+    def _groups(self, cells, by):
+        """Grupo de cada celda (-1 = fuera de la selección) y códigos de cada grupo."""
+        idx = np.flatnonzero(cells)
+        if not by:
+            group = np.full(self.n_cells, -1, dtype=np.int64)
+            group[idx] = 0
+            return group, {}, 1
+        key = np.zeros(len(idx), dtype=np.int64)
+        m = 1
+        for d in reversed(by):
+            key += self.cell_codes[d][idx].astype(np.int64) * m
+            m *= len(self.categories[d]) + 1
+        uniq, inv = np.unique(key, return_inverse=True)
+        group = np.full(self.n_cells, -1, dtype=np.int64)
+        group[idx] = inv.reshape(-1)
+        codes, m = {}, 1
+        for d in reversed(by):
+            codes[d] = (uniq // m) % (len(self.categories[d]) + 1)
+            m *= len(self.categories[d]) + 1
+        return group, codes, len(uniq)
+
+    def _excluded_rows(self, exclude_refs):
+        rows = [self.ref_rows[str(r)] for r in exclude_refs or () if str(r) in self.ref_rows]
+        return np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+    def _merge(self, group, n_groups, hidden_rows):
+        """Suma por grupo de unidades, sumas y sketches, restando las filas ocultas.
+
+        Cada sketch fusionado son pares (grupo, cubeta, unidades) ordenados y sin ceros.
+        """
+        sel = group >= 0
+        g = group[sel]
+        uds = np.bincount(g, weights=self.uds[sel], minlength=n_groups)
+        h_group = group[self.row_cell[hidden_rows]]
+        h_keep = h_group >= 0
+        hidden_rows, h_group = hidden_rows[h_keep], h_group[h_keep]
+        uds -= np.bincount(h_group, minlength=n_groups)
+
+        merged = {}
+        for name, meas in self.measures.items():
+            pg = group[meas.pair_cell]
+            keep = pg >= 0
+            hb = meas.row_bucket[hidden_rows]
+            ok = hb >= 0
+            # Pares de las celdas seleccionadas (+unidades) y de las filas ocultas (-1), sumados por clave
+            keys = np.concatenate([pg[keep] * meas.n_buckets + meas.pair_bucket[keep],
+                                   h_group[ok] * meas.n_buckets + hb[ok]])
+            weights = np.concatenate([meas.pair_count[keep], np.full(int(ok.sum()), -1, dtype=np.int32)])
+            uniq, inv = np.unique(keys, return_inverse=True)
+            counts = np.bincount(inv.reshape(-1), weights=weights, minlength=len(uniq)).round().astype(np.int64)
+            nz = counts > 0
+            total = np.bincount(g, weights=meas.sum[sel], minlength=n_groups)
+            total -= np.bincount(h_group[ok], weights=meas.row_value[hidden_rows][ok], minlength=n_groups)
+            merged[name] = (uniq[nz] // meas.n_buckets, uniq[nz] % meas.n_buckets, counts[nz], total)
+        return uds, merged
+
+    def slice(self, selections=None, by=(), exclude_refs=(), quantiles=QUANTILES):
+        """Tabla por combinación de ``by`` (dimensiones del cubo) para la selección dada.
+
+        Columnas: UDS y, por medida (VRM = €/m², PVP = €), nº de valores, media y percentiles.
+        """
+        by = tuple(d for d in by if d in self.dims)
+        group, codes, n_groups = self._groups(self.cell_mask(selections), by)
+        uds, merged = self._merge(group, n_groups, self._excluded_rows(exclude_refs))
+
+        out = {}
+        for d in by:
+            labels = np.array([None] + list(self.categories[d]), dtype=object)
+            out[d] = labels[codes[d]]
+        out['UDS'] = uds.astype(np.int64)
+        for name, (pair_group, pair_bucket, counts, total) in merged.items():
+            prefix = name.upper()
+            n = np.bincount(pair_group, weights=counts, minlength=n_groups).astype(np.int64)
+            out[f'{prefix}_N'] = n
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out[f'{prefix}_MEDIA'] = total / n
+            qs = _quantiles(pair_group, pair_bucket, counts, n_groups, self.measures[name].bucket_values(), quantiles)
+            for j, q in enumerate(quantiles):
+                out[f'{prefix}_P{round(q * 100)}'] = qs[:, j]
+        table = pd.DataFrame(out)
+        return table[table['UDS'] > 0].reset_index(drop=True)
+
+    def distribution(self, selections=None, measure='vrm', exclude_refs=(), bins=30):
+        """Histograma de la medida para la selección, re-agrupado en ``bins`` tramos lineales."""
+        group, _, n_groups = self._groups(self.cell_mask(selections), ())
+        _, merged = self._merge(group, n_groups, self._excluded_rows(exclude_refs))
+        _, pair_bucket, counts, _ = merged[measure]
+        hist = np.bincount(pair_bucket, weights=counts, minlength=self.measures[measure].n_buckets)
+        values = self.measures[measure].bucket_values()
+        nz = hist > 0
+        if not nz.any():
+            return pd.DataFrame({'desde': [], 'uds': []})
+        counts, edges = np.histogram(values[nz], bins=bins, weights=hist[nz])
+        return pd.DataFrame({'desde': np.round(edges[:-1]), 'uds': counts.astype(np.int64)})
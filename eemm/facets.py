@@ -0,0 +1,84 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# --- ÍNDICE DE FACETAS DE LOS FILTROS ---
+# Las columnas filtrables se pasan a categóricas una sola vez al cargar. Cada fila queda
+# como un código entero (0 = vacío, 1..n = posición de la categoría en orden alfabético),
+# así que filtrar es una tabla de consulta booleana indexada por código y contar por
+# opción es un bincount: sin conversiones a texto en cada rerun.
+
+FACETS = ('tipo', 'tier', 'zona', 'ciudad', 'planta', 'dorm')
+
+
+class FacetIndex:
+    def __init__(self, codes, categories, n_rows):
+        self.codes = codes              # facet -> np.ndarray de códigos (0 = NaN)
+        self.categories = categories    # facet -> lista ordenada de valores (str)
+        self.n_rows = n_rows
+        self._totals = {f: self._bincount(f, None) for f in codes}
+
+    def __contains__(self, facet):
+        return facet in self.codes
+
+    def options(self, facet):
+        return self.categories[facet]
+
+    def _bincount(self, facet, mask):
+        codes = self.codes[facet] if mask is None else self.codes[facet][mask]
+        return np.bincount(codes, minlength=len(self.categories[facet]) + 1)[1:]
+
+    def totals(self, facet):
+        """Unidades por opción en todo el dataset (estable entre reruns)."""
+        return dict(zip(self.categories[facet], self._totals[facet].tolist()))
+
+    def facet_mask(self, facet, selected):
+        lookup = {v: i + 1 for i, v in enumerate(self.categories[facet])}
+        allowed = np.zeros(len(self.categories[facet]) + 1, dtype=bool)
+        allowed[[lookup[v] for v in selected if v in lookup]] = True
+        return allowed[self.codes[facet]]
+
+    def mask(self, selections):
+        """Máscara booleana de filas que cumplen todas las facetas seleccionadas."""
+        mask = np.ones(self.n_rows, dtype=bool)
+        for facet, selected in selections.items():
+            if facet in self.codes and selected is not None:
+                mask &= self.facet_mask(facet, selected)
+        return mask
+
+    def live_counts(self, selections):
+        """Unidades por opción de cada faceta aplicando el resto de filtros."""
+        masks = {f: self.facet_mask(f, s) for f, s in selections.items() if f in self.codes and s is not None}
+        out = {}
+        for facet in self.codes:
+            mask = np.ones(self.n_rows, dtype=bool)
+            for other, m in masks.items():
+                if other != facet:
+                    mask &= m
+            out[facet] = dict(zip(self.categories[facet], self._bincount(facet, mask).tolist()))
+        return out
+
+
+def mask_digest(mask):
+    """Huella compacta de una máscara de filas, para memoizar cálculos por selección."""
+    mask = np.asarray(mask, dtype=bool)
+    return f"{len(mask)}:{hashlib.sha1(np.packbits(mask).tobytes()).hexdigest()}"
+
+
+def encode_facets(df, cols):
+    """Convierte las columnas de filtro a categóricas de texto y construye su índice."""
+    df = df.copy()
+    codes, categories = {}, {}
+    for facet in FACETS:
+        col = cols.get(facet)
+        if not col or col not in df.columns:
+            continue
+        s = df[col]
+        labels = s.astype(str).where(s.notna())
+        cats = sorted(labels.dropna().unique())
+        cat = pd.Categorical(labels, categories=cats)
+        df[col] = cat
+        codes[facet] = (cat.codes.astype(np.int32) + 1)
+        categories[facet] = cats
+    return df, FacetIndex(codes, categories, len(df))
@@ -0,0 +1,211 @@
+import hashlib
+import importlib.util
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# --- FICHAS PNG (BAJO DEMANDA, CACHEADAS Y EN PARALELO) ---
+# matplotlib sólo se importa al renderizar la primera ficha. Las exportaciones se
+# escriben en streaming: cada ficha se pinta, se vuelca al ZIP/PDF de destino y se
+# libera, así que la memoria pico no depende del número de promociones.
+
+MATPLOTLIB_INSTALLED = importlib.util.find_spec('matplotlib') is not None
+
+CACHE_MAX_ITEMS = 5000            # fichas PNG guardadas en memoria (LRU)...
+CACHE_MAX_BYTES = 64 * 2**20      # ...sin pasar de este presupuesto
+PARALLEL_MIN_ITEMS = 64           # arrancar el pool 'spawn' cuesta ~1.5 s (matplotlib en cada worker): por debajo no compensa
+STREAM_WINDOW = 32                # fichas en vuelo a la vez al exportar en streaming
+SPOOL_MAX_BYTES = 16 * 2**20      # a partir de aquí el fichero temporal de exportación pasa a disco
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _column(df, name, default):
+    if name and name in df.columns:
+        return df[name].tolist()
+    return [default] * len(df)
+
+
+def ficha_fields(df, cols):
+    """Extrae de ``df_promo`` las tuplas (ref, nombre, uds, pvp, vrm, tipos) de cada ficha."""
+    refs = [str(r) for r in df[cols['ref']].tolist()]
+    nombres = _column(df, cols['nombre'], None)
+    fields = []
+    for ref, nombre, uds, pvp, vrm, tipos in zip(
+            refs, nombres, df['UDS'].tolist(),
+            _column(df, cols['pvp'], 0), _column(df, cols['vrm'], 0), _column(df, cols['dorm'], 'N/A')):
+        nombre = ref if nombre is None else str(nombre)
+        if nombre.lower() in ['nan', 'none', '']: nombre = ref
+        fields.append((ref, nombre, uds, pvp, vrm, tipos))
+    return fields
+
+
+def clear_cache():
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
+
+
+def _cache_get(key):
+    with _cache_lock:
+        png = _cache.get(key)
+        if png is not None:
+            _cache.move_to_end(key)
+        return png
+
+
+def _cache_put(key, png):
+    global _cache_bytes
+    with _cache_lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_bytes -= len(old)
+        _cache[key] = png
+        _cache_bytes += len(png)
+        while _cache and (len(_cache) > CACHE_MAX_ITEMS or _cache_bytes > CACHE_MAX_BYTES):
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+
+def ficha_key(fields):
+    return hashlib.sha1(repr(fields).encode('utf-8')).hexdigest()
+
+
+def _draw_ficha(plt, fields):
+    ref, nombre, uds, pvp, vrm, tipos = fields
+
+    fig, ax = plt.subplots(figsize=(5.6, 1.8), dpi=200)
+    ax.axis('off')
+    
+    ax.add_patch(plt.Rectangle((0, 0), 1, 1, facecolor='#ffffff', edgecolor='#cccccc', linewidth=2, transform=ax.transAxes))
+    ax.add_patch(plt.Rectangle((0, 0), 0.02, 1, facecolor='#3a86ff', transform=ax.transAxes))
+    
+    ax.text(0.05, 0.72, f"{ref} - {nombre}", fontsize=14, fontweight='heavy', color='#003366', transform=ax.transAxes)
+    ax.text(0.05, 0.40, "Unidades:", fontsize=11, fontweight='bold', color='#666666', transform=ax.transAxes)
+    ax.text(0.25, 0.40, f"{uds}", fontsize=12, fontweight='bold', color='#121212', transform=ax.transAxes)
+    ax.text(0.48, 0.40, "PVP Medio:", fontsize=11, fontweight='bold', color='#666666', transform=ax.transAxes)
+    ax.text(0.72, 0.40, f"{pvp:,.0f} €", fontsize=12, fontweight='bold', color='#121212', transform=ax.transAxes)
+    ax.text(0.05, 0.15, "Unitario:", fontsize=11, fontweight='bold', color='#666666', transform=ax.transAxes)
+    ax.text(0.25, 0.15, f"{vrm:,.0f} €/m²", fontsize=12, fontweight='bold', color='#121212', transform=ax.transAxes)
+    ax.text(0.48, 0.15, "Tipologías:", fontsize=11, fontweight='bold', color='#666666', transform=ax.transAxes)
+    ax.text(0.72, 0.15, f"{tipos}", fontsize=12, fontweight='bold', color='#121212', transform=ax.transAxes)
+    return fig
+
+
+def render_ficha(fields):
+    """Pinta una ficha y devuelve los bytes del PNG."""
+    plt = _pyplot()
+    fig = _draw_ficha(plt, fields)
+    img_buf = io.BytesIO()
+    fig.savefig(img_buf, format='png', bbox_inches='tight', pad_inches=0.02)
+    plt.close(fig)
+    return img_buf.getvalue()
+
+
+def iter_fichas(fields_list, max_workers=None):
+    """Genera ``(fields, png)`` en orden, pintando sólo lo que no está en caché.
+
+    Las fichas pendientes se pintan por ventanas de ``STREAM_WINDOW`` (en un pool de
+    procesos si son suficientes), de modo que nunca hay más de una ventana en memoria.
+    """
+    pool = None
+    parallel = (max_workers or os.cpu_count() or 1) > 1
+    try:
+        for start in range(0, len(fields_list), STREAM_WINDOW):
+            window = fields_list[start:start + STREAM_WINDOW]
+            keys = [ficha_key(f) for f in window]
+            pngs = [_cache_get(k) for k in keys]
+            missing = [i for i, png in enumerate(pngs) if png is None]
+
+            if missing:
+                todo = [window[i] for i in missing]
+                if pool is None and parallel and len(fields_list) - start >= PARALLEL_MIN_ITEMS and len(todo) > 1:
+                    # 'spawn' evita heredar los hilos del servidor de Streamlit en el fork
+                    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+                rendered = pool.map(render_ficha, todo, chunksize=4) if pool is not None else map(render_ficha, todo)
+                for i, png in zip(missing, rendered):
+                    pngs[i] = png
+                    _cache_put(keys[i], png)
+
+            yield from zip(window, pngs)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def render_fichas(fields_list, max_workers=None):
+    """Devuelve los PNG de cada ficha reutilizando la caché por contenido."""
+    return [png for _, png in iter_fichas(fields_list, max_workers)]
+
+
+def _open_target(target, suffix):
+    if target is None:
+        return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, suffix=suffix)
+    if isinstance(target, (str, os.PathLike)):
+        return open(target, 'wb')
+    return target
+
+
+def _finish_target(target, fh):
+    if isinstance(target, (str, os.PathLike)):
+        fh.close()
+        return target
+    fh.seek(0)
+    return fh
+
+
+def write_zip(df, cols, target=None, max_workers=None):
+    """Escribe el ZIP de fichas en streaming.
+
+    ``target`` puede ser una ruta, un fichero abierto o ``None`` (fichero temporal
+    que pasa a disco al superar ``SPOOL_MAX_BYTES``). Devuelve la ruta o el fichero,
+    rebobinado y listo para leer.
+    """
+    fh = _open_target(target, '.zip')
+    try:
+        with zipfile.ZipFile(fh, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for fields, png in iter_fichas(ficha_fields(df, cols), max_workers):
+                zip_file.writestr(f"Ficha_{fields[0]}.png", png)
+    except BaseException:
+        if fh is not target: fh.close()
+        raise
+    return _finish_target(target, fh)
+
+
+def write_pdf(df, cols, target=None, title="Fichas comparables"):
+    """Informe PDF con una ficha por página, escrito página a página."""
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    plt = _pyplot()
+    fh = _open_target(target, '.pdf')
+    try:
+        with PdfPages(fh, metadata={'Title': title}) as pdf:
+            for fields in ficha_fields(df, cols):
+                fig = _draw_ficha(plt, fields)
+                pdf.savefig(fig, bbox_inches='tight', pad_inches=0.02)
+                plt.close(fig)
+    except BaseException:
+        if fh is not target: fh.close()
+        raise
+    return _finish_target(target, fh)
+
+
+def generate_zip_images(df, cols, max_workers=None):
+    zip_buffer = io.BytesIO()
+    write_zip(df, cols, zip_buffer, max_workers=max_workers)
+    return zip_buffer
@@ -0,0 +1,235 @@
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .ingest import CACHE_DIR
+from .instrument import log_event
+
+# --- GEOCODIFICACIÓN DE FILAS SIN COORD ---
+# Las filas con COORD vacío o mal formado se resuelven por dirección (DIRECCIÓN + CIUDAD)
+# con un cliente intercambiable: Google Maps en producción, un stub local en pruebas.
+# Cada dirección distinta se pide una sola vez: caché SQLite en disco compartida por
+# todos los estudios (también los "sin resultado", para no repetirlos), y las que faltan
+# se lanzan en paralelo. El límite de peticiones por segundo es uno por clave de API y
+# proceso, compartido por todos los hilos y sesiones; entre procesos no se comparte, así
+# que el pool de eemm.batch reparte MAX_QPS entre sus workers.
+
+GOOGLEMAPS_INSTALLED = importlib.util.find_spec('googlemaps') is not None
+
+ENV_GEOCODER = 'EEMM_GEOCODER'        # 'google' (por defecto con clave), 'stub:<fichero.json>' u 'off'
+ENV_API_KEY = 'GOOGLE_MAPS_API_KEY'
+GEOCODE_DB = os.environ.get('EEMM_GEOCODE_CACHE', os.path.join(CACHE_DIR, 'geocode.sqlite'))
+MAX_WORKERS = 8
+MAX_QPS = 20.0
+REGION = 'es'
+
+
+def address_key(address):
+    """Clave de caché: misma dirección con distinto espaciado o mayúsculas -> misma entrada."""
+    return re.sub(r'\s+', ' ', str(address)).strip().upper()
+
+
+# --- CLIENTES ---
+# Interfaz mínima: ``geocode(address) -> (lat, lon) | None``. Las excepciones se tratan
+# como fallos transitorios (no se cachean); ``None`` es "sin resultado" (sí se cachea).
+# ``rate_key`` identifica la cuota (misma clave -> mismo limitador) y ``qps`` su ritmo.
+
+class GoogleMapsGeocoder:
+    def __init__(self, api_key, region=REGION, accept_approximate=False, qps=MAX_QPS):
+        import googlemaps
+        # El ritmo lo marca nuestro limitador; el cliente sólo reintenta
+        self.client = googlemaps.Client(key=api_key, queries_per_second=1000)
+        self.region = region
+        self.accept_approximate = accept_approximate
+        self.rate_key = 'google:' + hashlib.sha1(api_key.encode('utf-8')).hexdigest()[:12]
+        self.qps = qps
+
+    def geocode(self, address):
+        results = self.client.geocode(address, region=self.region)
+        if not results:
+            return None
+        geometry = results[0]['geometry']
+        # APPROXIMATE = centro de municipio/código postal: pintaría la promoción en un sitio falso
+        if geometry.get('location_type') == 'APPROXIMATE' and not self.accept_approximate:
+            return None
+        return geometry['location']['lat'], geometry['location']['lng']
+
+
+class StubGeocoder:
+    """Cliente local para pruebas: tabla dirección -> (lat, lon), con latencia simulada."""
+
+    def __init__(self, table, latency=0.0, qps=None):
+        self.table = {address_key(k): tuple(v) if v is not None else None for k, v in dict(table).items()}
+        self.latency = latency
+        self.rate_key = f'stub:{id(self)}'
+        self.qps = qps              # None = sin límite
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_json(cls, path, latency=0.0):
+        with open(path, encoding='utf-8') as fh:
+            return cls(json.load(fh), latency)
+
+    def geocode(self, address):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.table.get(address_key(address))
+
+
+def default_geocoder(qps=MAX_QPS):
+    """Cliente según el entorno (EEMM_GEOCODER / GOOGLE_MAPS_API_KEY); None si no hay ninguno."""
+    mode = os.environ.get(ENV_GEOCODER, 'google').strip()
+    if mode.lower() == 'off':
+        return None
+    if mode.lower().startswith('stub:'):
+        return StubGeocoder.from_json(mode[5:])
+    api_key = os.environ.get(ENV_API_KEY)
+    if api_key and GOOGLEMAPS_INSTALLED:
+        return GoogleMapsGeocoder(api_key, qps=qps)
+    return None
+
+
+# --- CACHÉ PERSISTENTE ---
+
+class GeocodeCache:
+    """Caché SQLite dirección -> (lat, lon) | None, segura entre hilos y procesos."""
+
+    def __init__(self, path=None):
+        self.path = path or GEOCODE_DB
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as con:
+            con.execute("CREATE TABLE IF NOT EXISTS geocode (address TEXT PRIMARY KEY, lat REAL, lon REAL, ts REAL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        with self._connect() as con:
+            for i in range(0, len(keys), 500):   # límite de parámetros de SQLite
+                chunk = keys[i:i + 500]
+                rows = con.execute(f"SELECT address, lat, lon FROM geocode WHERE address IN ({','.join('?' * len(chunk))})", chunk)
+                for address, lat, lon in rows:
+                    found[address] = None if lat is None else (lat, lon)
+        return found
+
+    def put_many(self, results):
+        now = time.time()
+        with self._connect() as con:
+            con.executemany("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)",
+                            [(k, *(v if v is not None else (None, None)), now) for k, v in results.items()])
+
+
+class RateLimiter:
+    """Reparte las peticiones de todos los hilos a un máximo de ``qps`` por segundo."""
+
+    def __init__(self, qps=MAX_QPS):
+        self.interval = 1.0 / qps if qps else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def shared_limiter(client, qps=None):
+    """Limitador del proceso para la cuota del cliente (``rate_key``); lo crea con el primer ``qps``."""
+    key = getattr(client, 'rate_key', None) or f'client:{id(client)}'
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(qps if qps is not None else getattr(client, 'qps', MAX_QPS))
+        return limiter
+
+
+# --- GEOCODIFICACIÓN POR LOTES ---
+
+def geocode_addresses(addresses, client, cache=None, max_workers=MAX_WORKERS, qps=None):
+    """Resuelve direcciones (se deduplican); devuelve ``({clave: (lat, lon) | None}, stats)``.
+
+    El ritmo lo marca el limitador compartido del cliente; ``qps`` sólo cuenta si es el primero.
+    """
+    keys = sorted({address_key(a) for a in addresses if str(a).strip()})
+    cache = cache if cache is not None else GeocodeCache()
+    results = cache.get_many(keys)
+    pending = [k for k in keys if k not in results]
+    stats = {'direcciones': len(keys), 'cache': len(results), 'peticiones': len(pending), 'errores': 0}
+
+    if pending:
+        limiter = shared_limiter(client, qps)
+
+        def fetch(key):
+            limiter.wait()
+            try:
+                return key, client.geocode(key), True
+            except Exception:
+                return key, None, False
+
+        fresh = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as pool:
+            for key, value, ok in pool.map(fetch, pending):
+                if ok:
+                    fresh[key] = value
+                else:
+                    stats['errores'] += 1
+        cache.put_many(fresh)
+        results.update(fresh)
+    stats['resueltas'] = sum(v is not None for v in results.values())
+    return results, stats
+
+
+def row_addresses(df, cols):
+    """Dirección de búsqueda por fila: DIRECCIÓN + CIUDAD ('' si no hay dirección)."""
+    if not cols.get('direccion') or cols['direccion'] not in df.columns:
+        return pd.Series('', index=df.index)
+    # astype(object) antes de fillna: las columnas de texto llegan como categóricas
+    address = df[cols['direccion']].astype(object).fillna('').astype(str).str.strip()
+    if cols.get('ciudad') and cols['ciudad'] in df.columns:
+        ciudad = df[cols['ciudad']].astype(object).fillna('').astype(str).str.strip()
+        address = address.where(ciudad.eq('') | address.eq(''), address + ', ' + ciudad)
+    return address
+
+
+def fill_missing_coords(df, cols, client, cache=None, max_workers=MAX_WORKERS, qps=None):
+    """Rellena lat/lon de las filas sin coordenadas; marca en GEOCODED las resueltas así."""
+    missing = df['lat'].isna() | df['lon'].isna()
+    df = df.assign(GEOCODED=False)
+    if not missing.any():
+        return df
+    addresses = row_addresses(df[missing], cols)
+    addresses = addresses[addresses != '']
+    if addresses.empty:
+        return df
+
+    results, stats = geocode_addresses(addresses.unique(), client, cache, max_workers, qps)
+    coords = addresses.map(lambda a: results.get(address_key(a)))
+    coords = coords[coords.notna()]
+    if not coords.empty:
+        latlon = np.array(coords.tolist(), dtype=float)
+        df.loc[coords.index, 'lat'] = latlon[:, 0]
+        df.loc[coords.index, 'lon'] = latlon[:, 1]
+        df.loc[coords.index, 'GEOCODED'] = True
+    log_event('geocode', filas_sin_coord=int(missing.sum()), filas_resueltas=len(coords), **stats)
+    return df
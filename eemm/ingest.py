@@ -0,0 +1,227 @@
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .facets import FacetIndex, encode_facets
+from .instrument import log_event
+
+# --- INGESTA RÁPIDA DEL EXCEL EEMM ---
+# El parseo de XLSX (openpyxl) es lo más lento del arranque. Se hace una sola vez por
+# contenido: el resultado normalizado se guarda en Parquet, indexado por el hash de los
+# bytes subidos, y las siguientes cargas (o un reinicio del servidor) leen esa copia.
+# Esa copia ya es compacta: sólo columnas mapeadas (más las de EEMM_PASSTHROUGH),
+# numéricos reducidos sin pérdida y texto repetido como categóricas.
+
+SHEET_NAME = 'EEMM'
+INGEST_VERSION = 3   # subir si cambia la normalización para invalidar la caché en disco
+
+CACHE_DIR = os.environ.get('EEMM_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'eemm_cache'))
+PARQUET_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+# Columnas extra que se conservan tal cual (separadas por comas), p.ej. "SUPERFICIE,ESTADO"
+PASSTHROUGH_COLUMNS = tuple(c.strip().upper() for c in os.environ.get('EEMM_PASSTHROUGH', '').split(',') if c.strip())
+CATEGORY_MAX_RATIO = 0.5   # texto con <= 50% de valores distintos -> categórica
+
+_FIXED_COLUMNS = {'VRM SCIC', 'PVP', 'TIER', 'ZONA', 'PLANTA', 'Nº DORM'}
+_PATTERN_COLUMNS = ('COORD', 'REF', 'PROMOCI', 'NOMBRE', 'PROYECTO', 'TIPOLOGI', 'CIUDAD', 'DIRECCI')
+
+
+def normalize_name(col):
+    return str(col).strip().upper()
+
+
+def is_mapped_column(col):
+    name = normalize_name(col)
+    return name in _FIXED_COLUMNS or any(k in name for k in _PATTERN_COLUMNS)
+
+
+def resolve_columns(columns):
+    """Mapeo lógico -> columna real del Excel (cabeceras ya normalizadas)."""
+    columns = list(columns)
+    c = {
+        'coord': next((x for x in columns if 'COORD' in x), None),
+        'ref': next((x for x in columns if 'REF' in x), None),
+        'nombre': next((x for x in columns if any(k in x for k in ['PROMOCI', 'NOMBRE', 'PROYECTO'])), None),
+        'vrm': 'VRM SCIC', 'pvp': 'PVP', 'tipo': next((x for x in columns if 'TIPOLOGI' in x), None),
+        'tier': 'TIER', 'zona': 'ZONA', 'ciudad': next((x for x in columns if 'CIUDAD' in x), None),
+        'planta': 'PLANTA', 'dorm': 'Nº DORM',
+        'direccion': next((x for x in columns if 'DIRECCI' in x), None)
+    }
+    if not c['ref']: c['ref'] = c['nombre']
+    if not c['nombre']: c['nombre'] = c['ref']
+    return c
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _stringify_mixed(df):
+    # Parquet no admite columnas object con tipos mezclados (p.ej. PLANTA con 1, 2, 'BJ')
+    for col in df.columns[df.dtypes == object]:
+        s = df[col]
+        notna = s.notna()
+        if s[notna].map(type).nunique() > 1:
+            df[col] = s.where(~notna, s.astype(str))
+    return df
+
+
+def _parse_coord(value):
+    parts = str(value).replace(' ', '').split(',')
+    out = []
+    for part in parts[:2]:
+        try:
+            out.append(float(part))
+        except ValueError:
+            out.append(np.nan)
+    return (out + [np.nan, np.nan])[:2]
+
+
+def parse_coords(values):
+    """Columna 'lat, lon' -> dos arrays float64 (NaN si no se puede leer).
+
+    Cada valor distinto se parsea una sola vez (todas las unidades de una promoción
+    comparten COORD) y se reparte por código: sin frames intermedios de texto.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    parsed = np.array([_parse_coord(v) for v in uniques] + [[np.nan, np.nan]], dtype=float).reshape(-1, 2)
+    return parsed[codes, 0], parsed[codes, 1]   # código -1 (vacío) -> última fila, NaN
+
+
+def _downcast(s):
+    """Entero más pequeño que quepa; float32 sólo si no cambia ningún valor."""
+    if pd.api.types.is_bool_dtype(s):
+        return s
+    if pd.api.types.is_integer_dtype(s):
+        return pd.to_numeric(s, downcast='integer')
+    if pd.api.types.is_float_dtype(s) and s.dtype != np.float32:
+        small = s.astype(np.float32)
+        if np.array_equal(small.to_numpy(dtype=np.float64), s.to_numpy(), equal_nan=True):
+            return small
+    return s
+
+
+def compact_frame(df, c, passthrough=()):
+    """Deja sólo columnas mapeadas + ``passthrough``, reduce numéricos y pasa texto repetido a categórica.
+
+    Devuelve ``(df, informe)`` con los MB antes/después.
+    """
+    before = int(df.memory_usage(index=True, deep=True).sum())
+    keep = {v for v in c.values() if v} | {'lat', 'lon'} | set(passthrough)
+    df = df[[col for col in df.columns if col in keep]]
+
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if col in ('lat', 'lon'):
+            out[col] = s   # float64: la colocación de etiquetas trabaja a precisión completa
+        elif s.dtype == object or pd.api.types.is_string_dtype(s):
+            out[col] = s.astype('category') if s.nunique(dropna=True) <= CATEGORY_MAX_RATIO * max(len(s), 1) else s
+        else:
+            out[col] = _downcast(s)
+    df = pd.DataFrame(out, index=df.index)
+
+    after = int(df.memory_usage(index=True, deep=True).sum())
+    report = {'antes_mb': round(before / 2**20, 2), 'despues_mb': round(after / 2**20, 2),
+              'ahorro_pct': round(100 * (1 - after / before), 1) if before else 0.0,
+              'filas': len(df), 'columnas': len(df.columns)}
+    return df, report
+
+
+def parse_workbook(data, passthrough=()):
+    """Parseo lento: lee sólo las columnas mapeadas de la hoja EEMM, extrae lat/lon y compacta.
+
+    Las filas sin coordenadas válidas se conservan (lat/lon a NaN) para poder
+    geocodificarlas por dirección; ``load_workbook`` las descarta si no se piden.
+    El informe de memoria queda en ``df.attrs['memoria']``.
+    """
+    passthrough = {normalize_name(p) for p in passthrough}
+    df = pd.read_excel(io.BytesIO(data), sheet_name=SHEET_NAME,
+                       usecols=lambda col: is_mapped_column(col) or normalize_name(col) in passthrough)
+    df.columns = [normalize_name(c) for c in df.columns]
+    c = resolve_columns(df.columns)
+
+    if c['coord']:
+        df['lat'], df['lon'] = parse_coords(df[c['coord']])
+    elif c['direccion']:
+        df['lat'] = df['lon'] = np.nan
+    else:
+        return pd.DataFrame(), {}
+    df, report = compact_frame(_stringify_mixed(df), c, passthrough)
+    df.attrs['memoria'] = report
+    log_event('ingest', **report)
+    return df, c
+
+
+def _cache_paths(key, cache_dir, passthrough=()):
+    base = os.path.join(cache_dir, f"{key}-v{INGEST_VERSION}")
+    if passthrough:
+        base += '-' + hashlib.sha1('|'.join(sorted(passthrough)).encode('utf-8')).hexdigest()[:10]
+    return base + '.parquet', base + '.json'
+
+
+def load_workbook(data, cache_dir=None, keep_missing=False, passthrough=None):
+    """Devuelve ``(df, cols)`` para los bytes de un Excel EEMM, usando la caché columnar.
+
+    Con ``keep_missing`` se incluyen las filas sin lat/lon (NaN). ``passthrough``
+    (por defecto EEMM_PASSTHROUGH) son columnas extra que se conservan.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    passthrough = tuple(sorted({normalize_name(p) for p in (PASSTHROUGH_COLUMNS if passthrough is None else passthrough)}))
+    key = content_hash(data)
+    pq_path, meta_path = _cache_paths(key, cache_dir, passthrough)
+
+    if PARQUET_AVAILABLE and os.path.exists(pq_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, encoding='utf-8') as fh:
+                meta = json.load(fh)
+            df = pd.read_parquet(pq_path)
+            df.attrs['memoria'] = meta['memoria']
+            return _drop_missing(df, keep_missing), meta['cols']
+        except Exception:
+            pass   # caché corrupta o a medio escribir: se vuelve a parsear
+
+    df, c = parse_workbook(data, passthrough)
+
+    if PARQUET_AVAILABLE and c:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Escritura atómica para que otra sesión nunca lea un fichero a medias
+            suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+            tmp_pq, tmp_meta = pq_path + suffix, meta_path + suffix
+            df.to_parquet(tmp_pq, index=False)
+            with open(tmp_meta, 'w', encoding='utf-8') as fh:
+                json.dump({'cols': c, 'memoria': df.attrs['memoria']}, fh, ensure_ascii=False)
+            os.replace(tmp_pq, pq_path)
+            os.replace(tmp_meta, meta_path)
+        except Exception:
+            pass   # sin caché en disco seguimos funcionando igual
+    return _drop_missing(df, keep_missing), c
+
+
+def _drop_missing(df, keep_missing):
+    if not keep_missing and 'lat' in df.columns:
+        df = df.dropna(subset=['lat', 'lon'])
+    return df.reset_index(drop=True)
+
+
+def load_dataset(data, cache_dir=None, geocoder=None, passthrough=None):
+    """``load_workbook`` + filtros como categóricas: devuelve ``(df, cols, facets)``.
+
+    Con un ``geocoder`` (ver eemm.geocode) las filas sin COORD se resuelven por
+    dirección antes de descartar las que sigan sin coordenadas.
+    """
+    df, c = load_workbook(data, cache_dir, keep_missing=geocoder is not None, passthrough=passthrough)
+    if geocoder is not None and not df.empty:
+        from .geocode import fill_missing_coords
+        df = _drop_missing(fill_missing_coords(df, c, geocoder), keep_missing=False)
+    if df.empty:
+        return df, c, FacetIndex({}, {}, 0)
+    df, facets = encode_facets(df, c)
+    return df, c, facets
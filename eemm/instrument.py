@@ -0,0 +1,169 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# --- INSTRUMENTACIÓN POR ETAPAS ---
+# Tiempo de pared, filas y variación de memoria (RSS) de cada etapa de un rerun.
+# Cada etapa se emite además como una línea JSON en el logger 'eemm.perf'.
+
+ENV_VAR = 'EEMM_PROFILE'
+DEFERRED_PER_SESSION = 20      # últimas etapas diferidas que se guardan por sesión
+DEFERRED_SESSIONS = 256        # sesiones con etapas diferidas en memoria (las más antiguas salen)
+
+logger = logging.getLogger('eemm.perf')
+
+
+def env_enabled():
+    return os.environ.get(ENV_VAR, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def rss_bytes():
+    """Memoria residente del proceso (None si el sistema no expone /proc)."""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# --- ETAPAS DIFERIDAS ---
+# Streamlit ejecuta los ``data`` diferidos de st.download_button en otro hilo, cuando el
+# rerun ya ha terminado y su panel está pintado. Esas medidas se guardan aquí por sesión
+# para que el panel del siguiente rerun pueda listarlas.
+
+_deferred = OrderedDict()
+_deferred_lock = threading.Lock()
+
+
+def remember_deferred(session, record):
+    with _deferred_lock:
+        records = _deferred.pop(session, None) or deque(maxlen=DEFERRED_PER_SESSION)
+        records.append(record)
+        _deferred[session] = records
+        while len(_deferred) > DEFERRED_SESSIONS:
+            _deferred.popitem(last=False)
+
+
+def deferred_records(session):
+    """Etapas diferidas de la sesión (más antiguas primero)."""
+    with _deferred_lock:
+        return list(_deferred.get(session, ()))
+
+
+class RunTimer:
+    """Registro de las etapas de un rerun. Desactivado, ``stage`` no mide nada."""
+
+    def __init__(self, enabled=True, run_id=None, session=None):
+        self.enabled = enabled
+        self.run_id = run_id or uuid.uuid4().hex[:8]
+        self.session = session
+        self.records = []
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        info = {'rows': rows}
+        if not self.enabled:
+            yield info
+            return
+        rss0 = rss_bytes()
+        t0 = time.perf_counter()
+        try:
+            yield info
+        finally:
+            elapsed = time.perf_counter() - t0
+            rss1 = rss_bytes()
+            record = {
+                'run': self.run_id,
+                'stage': name,
+                'ms': round(elapsed * 1000, 2),
+                'rows': info.get('rows'),
+                'rss_delta_mb': round((rss1 - rss0) / 2**20, 2) if rss0 is not None and rss1 is not None else None,
+                'rss_mb': round(rss1 / 2**20, 1) if rss1 is not None else None,
+            }
+            info['record'] = record
+            self.records.append(record)
+            logger.info(json.dumps(dict(record, event='stage'), ensure_ascii=False))
+
+    def timed(self, name, fn, rows=None):
+        """Envuelve un callable (p.ej. la generación diferida del ZIP) para medirlo al ejecutarse.
+
+        Con ``session``, la medida queda también en deferred_records(session).
+        """
+        def wrapper(*args, **kwargs):
+            with self.stage(name, rows) as info:
+                result = fn(*args, **kwargs)
+            if self.session is not None and 'record' in info:
+                remember_deferred(self.session, info['record'])
+            return result
+        return wrapper
+
+    def total_ms(self):
+        return round(sum(r['ms'] for r in self.records), 2)
+
+
+def log_event(event, **fields):
+    """Línea JSON suelta en 'eemm.perf' (p.ej. contadores del almacén de datasets)."""
+    logger.info(json.dumps(dict(fields, event=event), ensure_ascii=False, default=str))
+
+
+class ProfileResult:
+    def __init__(self):
+        self.text = ''
+        self.pstats_bytes = b''
+
+
+class RerunProfiler:
+    """cProfile de un tramo arbitrario (p.ej. un rerun completo del script)."""
+
+    def __init__(self):
+        self._profiler = cProfile.Profile()
+
+    def start(self):
+        self._profiler.enable()
+
+    def stop(self, sort='cumulative', limit=60):
+        self._profiler.disable()
+        result = ProfileResult()
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats(sort).print_stats(limit)
+        result.text = out.getvalue()
+        fd, path = tempfile.mkstemp(suffix='.pstats')
+        try:
+            self._profiler.dump_stats(path)
+            with open(path, 'rb') as fh:
+                result.pstats_bytes = fh.read()
+        finally:
+            os.close(fd)
+            os.remove(path)
+        return result
+
+
+@contextmanager
+def profiled(sort='cumulative', limit=60):
+    """Perfila el bloque; al salir, el resultado tiene el informe en texto y el volcado pstats."""
+    result = ProfileResult()
+    profiler = RerunProfiler()
+    profiler.start()
+    try:
+        yield result
+    finally:
+        done = profiler.stop(sort, limit)
+        result.text, result.pstats_bytes = done.text, done.pstats_bytes
+
+
+def enable_logging(level=logging.INFO):
+    """Asegura que las líneas de 'eemm.perf' llegan a stderr (una sola vez por proceso)."""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(level)
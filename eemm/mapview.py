@@ -0,0 +1,167 @@
+import json
+
+import folium
+import pandas as pd
+from branca.element import MacroElement
+from jinja2 import Template
+
+from .markers import CELL_JS, MARKER_JS, build_smart_marker_html, frame_marker_records
+from .placement import place_markers
+from .pyramid import DETAIL_ZOOM, pyramid_levels
+from .tiles import CARTO_TILES, SATELLITE_LABELS, SATELLITE_TILES, tile_layers  # noqa: F401 (constantes reexportadas)
+
+# --- MAPA FOLIUM (se importa bajo demanda: folium sólo se carga al pintar un mapa) ---
+
+
+def base_map(tipo_vista="Callejero", estilo_mapa="Estándar"):
+    m = folium.Map(tiles=None, control_scale=False, zoom_control=True)
+    for layer in tile_layers(tipo_vista, estilo_mapa):
+        folium.TileLayer(tiles=layer['url'], attr=layer['attr'], name=layer['name'], overlay=layer['overlay']).add_to(m)
+    return m
+
+
+def add_subject(m, lat, lon, radius_m=None):
+    """Marca el punto de origen de una búsqueda de comparables (y su radio, si lo hay)."""
+    if radius_m:
+        folium.Circle([lat, lon], radius=radius_m, color='#ff9f1c', weight=1.5, fill=True, fill_opacity=0.06).add_to(m)
+    folium.CircleMarker([lat, lon], radius=6, color='white', weight=2, fill=True, fill_color='#ff9f1c', fill_opacity=1).add_to(m)
+    return m
+
+
+def add_promotions(m, df_visible, cols, show_price=True, light=True, pyramid=None):
+    """Encuadra el mapa y añade un marcador inteligente por promoción visible.
+
+    Con ``pyramid`` (salida de GridPyramid.summarize) y capa ligera, los zooms bajos
+    muestran celdas agregadas y los marcadores sólo aparecen a partir de DETAIL_ZOOM.
+    """
+    if df_visible.empty:
+        return m
+    sw, ne = df_visible[['lat', 'lon']].min().values.tolist(), df_visible[['lat', 'lon']].max().values.tolist()
+    m.fit_bounds([sw, ne])
+
+    if light:
+        # Un único array de datos (con la colocación ya aplicada); las etiquetas se montan en el navegador
+        records = frame_marker_records(df_visible, cols)
+        if pyramid is not None:
+            PyramidLayer(pyramid, show_price).add_to(m)
+        MarkerDataLayer(records, show_price, detail_zoom=DETAIL_ZOOM if pyramid is not None else None).add_to(m)
+    else:
+        # Algoritmo Base de separación (pre-asigna derecha/izquierda inicial) con índice espacial
+        placement = place_markers(df_visible)
+        vrm_vals = df_visible[cols['vrm']] if cols['vrm'] in df_visible.columns else pd.Series(0, index=df_visible.index)
+        for ref_str, val_vrm, direction, final_lat, final_lon in zip(
+                df_visible[cols['ref']].astype(str), vrm_vals,
+                placement['dir'], placement['lat'], placement['lon']):
+            # Construimos el marcador mágico interactivo
+            marker_html = build_smart_marker_html(ref_str, val_vrm, direction, show_price)
+            folium.Marker(
+                [final_lat, final_lon],
+                icon=folium.DivIcon(html=marker_html, icon_anchor=(13, 10))
+            ).add_to(m)
+    return m
+
+
+def build_map(df_visible, cols, show_price=True, tipo_vista="Callejero", estilo_mapa="Estándar", light=True, subject=None, pyramid=None):
+    m = base_map(tipo_vista, estilo_mapa)
+    if subject is not None:
+        add_subject(m, *subject)
+    return add_promotions(m, df_visible, cols, show_price, light, pyramid)
+
+
+# --- CAPA LIGERA: MARCADORES COMO DATOS + PLANTILLA JS COMPARTIDA ---
+# En lugar de un folium.Marker con HTML propio por promoción, se envía un único array
+# compacto [ref, lat, lon, vrm, dir] y el navegador construye las etiquetas con la
+# misma maqueta que build_smart_marker_html. El tamaño del payload crece unos pocos
+# bytes por marcador en vez de ~2 KB.
+
+class MarkerDataLayer(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var data = {{ this.data_json }};
+            var showPrice = {{ this.show_price_js }};
+            var detailZoom = {{ this.detail_zoom_js }};
+            {{ this.marker_js }}
+
+            var layer = L.layerGroup();
+            for (var i = 0; i < data.length; i++) {
+                var d = data[i];
+                var icon = L.divIcon({className: 'empty', html: eemmMarkerHtml(d, showPrice), iconAnchor: [13, 10]});
+                var marker = L.marker([d[1], d[2]], {icon: icon});
+                if (showPrice) marker.on('click', eemmFlip);
+                layer.addLayer(marker);
+            }
+            if (detailZoom === null) {
+                layer.addTo(map);
+            } else {
+                // Con pirámide: marcadores individuales sólo a partir del zoom de detalle
+                var sync = function() {
+                    if (map.getZoom() >= detailZoom) { if (!map.hasLayer(layer)) layer.addTo(map); }
+                    else if (map.hasLayer(layer)) map.removeLayer(layer);
+                };
+                map.on('zoomend', sync);
+                map.whenReady(sync);
+            }
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, records, show_price=True, detail_zoom=None):
+        super().__init__()
+        self._name = 'MarkerDataLayer'
+        # '</' escapado para que un REF nunca pueda cerrar la etiqueta <script>
+        self.data_json = json.dumps(records, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+        self.show_price_js = 'true' if show_price else 'false'
+        self.detail_zoom_js = 'null' if detail_zoom is None else int(detail_zoom)
+        self.marker_js = MARKER_JS
+
+
+# --- PIRÁMIDE: CELDAS AGREGADAS PARA ZOOMS BAJOS ---
+# Un nivel de celdas por banda de zoom ([zoom máximo, [[lat, lon, uds, promos, vrm, pvp,
+# s, w, n, e], ...]]); el navegador muestra sólo la banda del zoom actual. Pulsar una
+# celda hace zoom a su extensión.
+
+class PyramidLayer(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var levels = {{ this.data_json }};
+            var showPrice = {{ this.show_price_js }};
+            {{ this.cell_js }}
+
+            var groups = levels.map(function(level) {
+                var group = L.layerGroup();
+                level[1].forEach(function(d) {
+                    var bounds = [[d[6], d[7]], [d[8], d[9]]];
+                    var zoomIn = function(e) { map.fitBounds(bounds); L.DomEvent.stopPropagation(e); };
+                    L.rectangle(bounds, {color: '#3a86ff', weight: 1, opacity: 0.5, fillOpacity: 0.08})
+                        .on('click', zoomIn).addTo(group);
+                    L.marker([d[0], d[1]], {icon: L.divIcon({className: 'empty', html: eemmCellHtml(d, showPrice), iconSize: null})})
+                        .bindTooltip(eemmCellTip(d), {direction: 'top'}).on('click', zoomIn).addTo(group);
+                });
+                return group;
+            });
+            function sync() {
+                var z = map.getZoom(), active = -1;
+                for (var i = 0; i < levels.length; i++) {
+                    if (z <= levels[i][0]) { active = i; break; }
+                }
+                groups.forEach(function(group, i) {
+                    if (i === active) { if (!map.hasLayer(group)) group.addTo(map); }
+                    else if (map.hasLayer(group)) map.removeLayer(group);
+                });
+            }
+            map.on('zoomend', sync);
+            map.whenReady(sync);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, levels, show_price=True):
+        super().__init__()
+        self._name = 'PyramidLayer'
+        self.data_json = json.dumps(pyramid_levels(levels), separators=(',', ':'))
+        self.show_price_js = 'true' if show_price else 'false'
+        self.cell_js = CELL_JS
@@ -0,0 +1,145 @@
+import math
+
+import pandas as pd
+
+from .placement import place_markers
+
+# --- FUNCIÓN GENERADORA DE ETIQUETAS INTERACTIVAS (JS NATIVO) ---
+def build_smart_marker_html(ref_str, val_vrm, direction, show_price):
+    if not show_price:
+        return f"""
+        <div style="drop-shadow: 0 2px 4px rgba(0,0,0,0.6); font-family: Arial, sans-serif;">
+            <div style="background-color: #3a86ff; color: white; border-radius: 12px; min-width: 26px; height: 20px; 
+                        display: flex; justify-content: center; align-items: center; font-size: 10px; 
+                        font-weight: bold; border: 1.5px solid white; padding: 0 4px;">
+                {ref_str}
+            </div>
+        </div>
+        """
+        
+    # Inicialización basada en el algoritmo Python
+    if direction == "right":
+        align_style = "left: 15px;"
+        pad_style = "1px 6px 1px 12px"
+    else:
+        align_style = "right: 15px;"
+        pad_style = "1px 12px 1px 6px"
+    
+    # ¡LA MAGIA JAVASCRIPT! Permite hacer click para cambiar el lado al vuelo
+    js_code = """
+    var p = this.querySelector('.tag-price');
+    if (p.style.left) {
+        p.style.left = '';
+        p.style.right = '15px';
+        p.style.padding = '1px 12px 1px 6px';
+    } else {
+        p.style.right = '';
+        p.style.left = '15px';
+        p.style.padding = '1px 6px 1px 12px';
+    }
+    event.stopPropagation();
+    """
+    
+    return f"""
+    <div style="position: relative; width: 26px; height: 20px; font-family: Arial, sans-serif; cursor: pointer;" onclick="{js_code}">
+        <div class="tag-price" style="position: absolute; {align_style} top: 0px; background-color: white; 
+                    border: 1.5px solid #3a86ff; border-radius: 4px; padding: {pad_style}; 
+                    font-size: 10px; font-weight: bold; color: #121212; white-space: nowrap; z-index: 1; transition: all 0.25s ease;">
+            {val_vrm:,.0f} €/m²
+        </div>
+        <div style="position: absolute; left: 0; top: 0; background-color: #3a86ff; color: white; border-radius: 12px;
+                    min-width: 26px; height: 20px; display: flex; justify-content: center; align-items: center;
+                    font-size: 10px; font-weight: bold; border: 1.5px solid white; z-index: 2; padding: 0 4px;">
+            {ref_str}
+        </div>
+    </div>
+    """
+
+
+# --- CAPA LIGERA: MARCADORES COMO DATOS ---
+# Registros compactos [ref, lat, lon, vrm, dir] que consume eemm.mapview.MarkerDataLayer
+
+def marker_records(refs, lats, lons, vrms, directions):
+    records = []
+    for ref, lat, lon, vrm, direction in zip(refs, lats, lons, vrms, directions):
+        vrm = float(vrm)
+        records.append([str(ref), round(float(lat), 6), round(float(lon), 6),
+                        None if math.isnan(vrm) else round(vrm), 1 if direction == "right" else 0])
+    return records
+
+
+def frame_marker_records(df, cols):
+    """Registros de marcador de un frame de promociones, con la colocación de etiquetas aplicada."""
+    placement = place_markers(df)
+    vrm_vals = df[cols['vrm']] if cols['vrm'] in df.columns else pd.Series(0, index=df.index)
+    return marker_records(df[cols['ref']], placement['lat'], placement['lon'], vrm_vals, placement['dir'])
+
+
+# --- PLANTILLAS JS COMPARTIDAS ---
+# Misma maqueta que build_smart_marker_html, montada en el navegador a partir de los
+# registros. La usan las capas folium (eemm.mapview) y el mapa incremental (ui.live_map).
+
+MARKER_JS = """
+var EEMM_FMT = new Intl.NumberFormat('en-US', {maximumFractionDigits: 0});
+var EEMM_PILL = 'background-color: #3a86ff; color: white; border-radius: 12px; '
+    + 'min-width: 26px; height: 20px; display: flex; justify-content: center; align-items: center; '
+    + 'font-size: 10px; font-weight: bold; border: 1.5px solid white; padding: 0 4px;';
+var EEMM_PILL_ABS = 'position: absolute; left: 0; top: 0; z-index: 2; ' + EEMM_PILL;
+var EEMM_TAG = 'position: absolute; top: 0px; background-color: white; border: 1.5px solid #3a86ff; border-radius: 4px; '
+    + 'font-size: 10px; font-weight: bold; color: #121212; white-space: nowrap; z-index: 1; transition: all 0.25s ease;';
+var EEMM_RIGHT = 'left: 15px; padding: 1px 6px 1px 12px;';
+var EEMM_LEFT = 'right: 15px; padding: 1px 12px 1px 6px;';
+
+function eemmEsc(s) {
+    return String(s).replace(/[&<>"']/g, function(ch) {
+        return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[ch];
+    });
+}
+// d = [ref, lat, lon, vrm, dir]
+function eemmMarkerHtml(d, showPrice) {
+    var ref = eemmEsc(d[0]);
+    if (!showPrice) {
+        return '<div style="drop-shadow: 0 2px 4px rgba(0,0,0,0.6); font-family: Arial, sans-serif;">'
+            + '<div style="' + EEMM_PILL + '">'
+            + ref + '</div></div>';
+    }
+    var vrm = d[3] === null ? 'nan' : EEMM_FMT.format(d[3]);
+    return '<div style="position: relative; width: 26px; height: 20px; font-family: Arial, sans-serif; cursor: pointer;">'
+        + '<div class="tag-price" style="' + EEMM_TAG + (d[4] ? EEMM_RIGHT : EEMM_LEFT) + '">' + vrm + ' €/m²</div>'
+        + '<div style="' + EEMM_PILL_ABS + '">' + ref + '</div></div>';
+}
+// Mismo comportamiento que el onclick de build_smart_marker_html: cambia el lado de la etiqueta
+function eemmFlip(e) {
+    var p = this.getElement() && this.getElement().querySelector('.tag-price');
+    if (!p) return;
+    if (p.style.left) {
+        p.style.left = '';
+        p.style.right = '15px';
+        p.style.padding = '1px 12px 1px 6px';
+    } else {
+        p.style.right = '';
+        p.style.left = '15px';
+        p.style.padding = '1px 6px 1px 12px';
+    }
+    L.DomEvent.stopPropagation(e);
+}
+"""
+
+CELL_JS = """
+var EEMM_FMT = new Intl.NumberFormat('en-US', {maximumFractionDigits: 0});
+var EEMM_BUBBLE = 'transform: translate(-50%, -50%); display: inline-flex; flex-direction: column; align-items: center; '
+    + 'background-color: rgba(18,18,18,0.85); border: 1.5px solid #3a86ff; border-radius: 10px; padding: 2px 7px; '
+    + 'font-family: Arial, sans-serif; font-size: 10px; font-weight: bold; color: white; white-space: nowrap; cursor: zoom-in;';
+
+// d = [lat, lon, uds, promos, vrm, pvp, s, w, n, e]
+function eemmCellHtml(d, showPrice) {
+    var out = '<div style="' + EEMM_BUBBLE + '"><span>' + EEMM_FMT.format(d[2]) + ' uds</span>';
+    if (showPrice && d[4] !== null) out += '<span style="color: #8ab4ff;">' + EEMM_FMT.format(d[4]) + ' €/m²</span>';
+    return out + '</div>';
+}
+function eemmCellTip(d) {
+    return d[3] + ' promociones · ' + EEMM_FMT.format(d[2]) + ' uds'
+        + (d[4] === null ? '' : '<br>VRM mediana: ' + EEMM_FMT.format(d[4]) + ' €/m²')
+        + (d[5] === null ? '' : '<br>PVP medio: ' + EEMM_FMT.format(d[5]) + ' €');
+}
+"""
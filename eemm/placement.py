@@ -0,0 +1,90 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# --- MOTOR DE COLOCACIÓN DE ETIQUETAS ---
+# Replica exactamente el algoritmo histórico del bucle del mapa (vecinos a distancia
+# euclídea en grados < CLUSTER_THRESHOLD sobre las posiciones ya colocadas), pero
+# buscando vecinos en un índice de rejilla (grid-hash) en lugar de recorrer todos
+# los marcadores procesados: O(n·k) en vez de O(n²).
+
+CLUSTER_THRESHOLD = 0.0025
+OFFSET_STEP = 0.0004
+
+RIGHT = "right"
+LEFT = "left"
+
+
+def _cell(lat, lon, size):
+    return (math.floor(lat / size), math.floor(lon / size))
+
+
+def place_labels(lat, lon, threshold=CLUSTER_THRESHOLD, step=OFFSET_STEP):
+    """Calcula dirección de etiqueta y posición final de cada marcador.
+
+    Recibe dos secuencias de coordenadas en el orden de pintado y devuelve
+    ``(directions, final_lat, final_lon)`` como arrays de numpy.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    n = len(lat)
+
+    directions = np.empty(n, dtype=object)
+    final_lat = lat.copy()
+    final_lon = lon.copy()
+
+    # Celdas de lado >= umbral: cualquier vecino está en la celda propia o en las 8 contiguas
+    # (el pequeño margen absorbe el redondeo de la división en los bordes de celda)
+    size = threshold * (1 + 1e-9)
+    grid = {}
+    placed_lat, placed_lon, placed_right = [], [], []
+
+    for i, (cur_lat, cur_lon) in enumerate(zip(lat.tolist(), lon.tolist())):
+        ci, cj = _cell(cur_lat, cur_lon, size)
+        n_neighbors = 0
+        n_right = 0
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for k in grid.get((ci + di, cj + dj), ()):
+                    dist = ((cur_lat - placed_lat[k])**2 + (cur_lon - placed_lon[k])**2)**0.5
+                    if dist < threshold:
+                        n_neighbors += 1
+                        n_right += placed_right[k]
+
+        direction = RIGHT
+        offset = 0
+        if n_neighbors:
+            has_right = n_right > 0
+            has_left = n_right < n_neighbors
+            if has_right and not has_left:
+                direction = LEFT
+            elif has_right and has_left:
+                direction = RIGHT if n_neighbors % 2 == 0 else LEFT
+                offset = step * n_neighbors
+
+        f_lat = cur_lat + offset
+        f_lon = cur_lon + offset
+        directions[i] = direction
+        final_lat[i] = f_lat
+        final_lon[i] = f_lon
+
+        placed_lat.append(f_lat)
+        placed_lon.append(f_lon)
+        placed_right.append(direction == RIGHT)
+        grid.setdefault(_cell(f_lat, f_lon, size), []).append(i)
+
+    return directions, final_lat, final_lon
+
+
+def place_markers(df, threshold=CLUSTER_THRESHOLD, step=OFFSET_STEP):
+    """Aplica ``place_labels`` a un DataFrame con columnas ``lat``/``lon``.
+
+    Devuelve un DataFrame con el mismo índice y columnas ``dir``, ``lat`` y ``lon``
+    (posición final del marcador, ya desplazada si procede).
+    """
+    if df.empty:
+        return pd.DataFrame({'dir': pd.Series(dtype=object), 'lat': pd.Series(dtype=float),
+                             'lon': pd.Series(dtype=float)}, index=df.index)
+    directions, final_lat, final_lon = place_labels(df['lat'].to_numpy(), df['lon'].to_numpy(), threshold, step)
+    return pd.DataFrame({'dir': directions, 'lat': final_lat, 'lon': final_lon}, index=df.index)
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+# --- PIRÁMIDE DE AGREGACIÓN POR NIVEL DE ZOOM ---
+# Rejillas lat/lon de celda decreciente, una por banda de zoom. La asignación fila -> celda
+# y el orden (celda, VRM) para las medianas se calculan una vez por dataset; cada cambio de
+# filtros sólo recorre la máscara con bincount, sin reagrupar ni reordenar filas.
+# Cada fila cae en la celda de la coordenada de su promoción (primera por REF), igual que
+# el marcador de aggregate_promotions, así que una promoción nunca se parte entre celdas.
+
+# (zoom máximo de la banda, tamaño de celda en grados): ~60 px por celda en cada banda
+ZOOM_BANDS = ((8, 0.32), (10, 0.08), (12, 0.02))
+DETAIL_ZOOM = ZOOM_BANDS[-1][0] + 1     # a partir de aquí, marcadores individuales
+MIN_MARKERS = 300                       # por debajo, la vista agregada no aporta
+_ROW_STRIDE = 1 << 32                   # clave de celda = fila * _ROW_STRIDE + columna desplazada
+_COL_OFFSET = 1 << 31
+
+
+class GridPyramid:
+    def __init__(self, refs, lat, lon, vrm, pvp, bands=ZOOM_BANDS):
+        self.bands = tuple(bands)
+        self.ref_codes, self.ref_values = pd.factorize(pd.Series(refs).astype(str), sort=False)
+        self.ref_values = np.asarray(self.ref_values, dtype=object)
+        self.ref_index = pd.Index(self.ref_values)
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.vrm = np.asarray(vrm, dtype=float)
+        self.pvp = np.asarray(pvp, dtype=float)
+        self.n_rows = len(self.lat)
+
+        self.levels = []
+        for max_zoom, cell_deg in self.bands:
+            rows = np.floor(self.lat / cell_deg).astype(np.int64)
+            keys = rows * _ROW_STRIDE + np.floor(self.lon / cell_deg).astype(np.int64) + _COL_OFFSET
+            uniq, codes = np.unique(keys, return_inverse=True)
+            codes = codes.reshape(-1).astype(np.int32)
+            cells = np.column_stack([uniq // _ROW_STRIDE, uniq % _ROW_STRIDE - _COL_OFFSET])
+            # Celda de cada promoción (todas sus filas comparten coordenada)
+            ref_cell = np.zeros(len(self.ref_values), dtype=np.int32)
+            ref_cell[self.ref_codes] = codes
+            # Orden por (celda, VRM) con los NaN al final de cada celda: medianas por tramos
+            order = np.lexsort((self.vrm, codes))
+            self.levels.append({'max_zoom': max_zoom, 'cell_deg': cell_deg, 'cells': cells,
+                                'codes': codes, 'ref_cell': ref_cell, 'order': order})
+
+    @classmethod
+    def from_frame(cls, df, cols, bands=ZOOM_BANDS):
+        """Una fila por unidad del EEMM; coordenadas de la promoción a la que pertenece."""
+        ref = df[cols['ref']]
+        lat = df.groupby(ref, sort=False, observed=True)['lat'].transform('first')
+        lon = df.groupby(ref, sort=False, observed=True)['lon'].transform('first')
+        vrm = pd.to_numeric(df[cols['vrm']], errors='coerce') if cols['vrm'] in df.columns else np.full(len(df), np.nan)
+        pvp = pd.to_numeric(df[cols['pvp']], errors='coerce') if cols['pvp'] in df.columns else np.full(len(df), np.nan)
+        return cls(ref, lat, lon, vrm, pvp, bands)
+
+    def __len__(self):
+        return self.n_rows
+
+    def row_mask(self, mask=None, refs=None):
+        """Máscara de filas: máscara de filtros (o todas) restringida a las REF dadas."""
+        out = np.ones(self.n_rows, dtype=bool) if mask is None else np.asarray(mask, dtype=bool).copy()
+        if refs is not None:
+            allowed = self.ref_index.isin([str(r) for r in refs])
+            out &= allowed[self.ref_codes]
+        return out
+
+    def _level_summary(self, level, mask):
+        codes, n_cells = level['codes'], len(level['cells'])
+        c = codes[mask]
+        uds = np.bincount(c, minlength=n_cells)
+        lat_sum = np.bincount(c, weights=self.lat[mask], minlength=n_cells)
+        lon_sum = np.bincount(c, weights=self.lon[mask], minlength=n_cells)
+
+        pvp_ok = mask & ~np.isnan(self.pvp)
+        pvp_n = np.bincount(codes[pvp_ok], minlength=n_cells)
+        pvp_sum = np.bincount(codes[pvp_ok], weights=self.pvp[pvp_ok], minlength=n_cells)
+
+        # Mediana de VRM: tramos contiguos por celda en el orden precalculado
+        order = level['order']
+        sel = order[mask[order] & ~np.isnan(self.vrm[order])]
+        vrm_med = np.full(n_cells, np.nan)
+        if len(sel):
+            sc, sv = codes[sel], self.vrm[sel]
+            starts = np.flatnonzero(np.r_[True, sc[1:] != sc[:-1]])
+            counts = np.diff(np.r_[starts, len(sc)])
+            vrm_med[sc[starts]] = (sv[starts + (counts - 1) // 2] + sv[starts + counts // 2]) / 2
+
+        # Promociones distintas por celda
+        present = np.bincount(self.ref_codes[mask], minlength=len(self.ref_values)) > 0
+        promos = np.bincount(level['ref_cell'][present], minlength=n_cells)
+
+        keep = uds > 0
+        cell_deg = level['cell_deg']
+        cells = level['cells'][keep]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pd.DataFrame({
+                'lat': lat_sum[keep] / uds[keep],
+                'lon': lon_sum[keep] / uds[keep],
+                'UDS': uds[keep],
+                'PROMOS': promos[keep],
+                'VRM': vrm_med[keep],
+                'PVP': pvp_sum[keep] / pvp_n[keep],
+                'south': cells[:, 0] * cell_deg,
+                'west': cells[:, 1] * cell_deg,
+                'north': (cells[:, 0] + 1) * cell_deg,
+                'east': (cells[:, 1] + 1) * cell_deg,
+            })
+
+    def summarize(self, mask=None, refs=None):
+        """Lista de (zoom máximo, DataFrame de celdas) por banda para las filas seleccionadas."""
+        rows = self.row_mask(mask, refs)
+        return [(level['max_zoom'], self._level_summary(level, rows)) for level in self.levels]
+
+
+def cell_records(cells):
+    """DataFrame de celdas -> filas compactas [lat, lon, uds, promos, vrm|None, pvp|None, s, w, n, e]."""
+    out = []
+    for lat, lon, uds, promos, vrm, pvp, s, w, n, e in cells[['lat', 'lon', 'UDS', 'PROMOS', 'VRM', 'PVP',
+                                                                'south', 'west', 'north', 'east']].itertuples(index=False):
+        out.append([round(lat, 6), round(lon, 6), int(uds), int(promos),
+                    None if pd.isna(vrm) else round(vrm), None if pd.isna(pvp) else round(pvp),
+                    round(s, 6), round(w, 6), round(n, 6), round(e, 6)])
+    return out
+
+
+def pyramid_levels(summary):
+    """Salida de GridPyramid.summarize -> [[zoom máximo, cell_records], ...] listo para JSON."""
+    return [[max_zoom, cell_records(cells)] for max_zoom, cells in summary]
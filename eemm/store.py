@@ -0,0 +1,153 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+# --- ALMACÉN DE DATASETS COMPARTIDO ENTRE SESIONES ---
+# Un único almacén por proceso, indexado por el hash del contenido del Excel: varias
+# sesiones que suben el mismo libro comparten un solo parseo y una sola copia en
+# memoria. Tiene presupuesto de memoria con expulsión LRU, volcado opcional a disco
+# de lo expulsado y contadores de aciertos/fallos/expulsiones para monitorizar.
+
+DEFAULT_MAX_MB = int(os.environ.get('EEMM_STORE_MAX_MB', '1024'))
+DEFAULT_SPILL_DIR = os.environ.get('EEMM_STORE_SPILL_DIR') or None
+
+
+def estimate_nbytes(value):
+    """Tamaño aproximado en memoria de un dataset (DataFrame, arrays y contenedores)."""
+    if hasattr(value, 'memory_usage'):
+        # DataFrame -> una cifra por columna; Series e Index -> un entero
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(v) for v in value.values())
+    if hasattr(value, '__dict__'):
+        return estimate_nbytes(vars(value))
+    return 0
+
+
+class DatasetStore:
+    def __init__(self, max_bytes=DEFAULT_MAX_MB * 2**20, spill_dir=DEFAULT_SPILL_DIR):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self._items = OrderedDict()     # key -> (value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading = {}              # key -> Lock, para no parsear dos veces el mismo libro
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'spills': 0, 'spill_hits': 0}
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.pkl")
+
+    def get(self, key):
+        """Valor guardado (recuperándolo del disco si se había volcado) o None."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self._stats['hits'] += 1
+                return item[0]
+        value = self._load_spilled(key)
+        with self._lock:
+            if value is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['spill_hits'] += 1
+        self.put(key, value)
+        return value
+
+    def _load_spilled(self, key):
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self._spill_path(key), 'rb') as fh:
+                return pickle.load(fh)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def put(self, key, value, nbytes=None):
+        nbytes = estimate_nbytes(value) if nbytes is None else nbytes
+        evicted = []
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (value, nbytes)
+            self._bytes += nbytes
+            # Nunca se expulsa lo recién insertado, aunque él solo supere el presupuesto
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                old_key, (old_value, old_nbytes) = self._items.popitem(last=False)
+                self._bytes -= old_nbytes
+                self._stats['evictions'] += 1
+                evicted.append((old_key, old_value))
+        for old_key, old_value in evicted:
+            self._spill(old_key, old_value)
+        return value
+
+    def _spill(self, key, value):
+        if not self.spill_dir:
+            return
+        path = self._spill_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as fh:
+                pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+            with self._lock:
+                self._stats['spills'] += 1
+        except OSError:
+            pass
+
+    def get_or_load(self, key, loader):
+        """Devuelve el valor de ``key`` o lo calcula con ``loader()`` una sola vez por proceso."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            # Otra sesión pudo cargarlo mientras esperábamos
+            with self._lock:
+                item = self._items.get(key)
+            if item is not None:
+                return item[0]
+            try:
+                return self.put(key, loader())
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['spill_hits'] + self._stats['misses']
+            return dict(self._stats, items=len(self._items), bytes=self._bytes, max_bytes=self.max_bytes,
+                        hit_rate=round((self._stats['hits'] + self._stats['spill_hits']) / lookups, 3) if lookups else None)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Almacén compartido del proceso (configurable con EEMM_STORE_MAX_MB y EEMM_STORE_SPILL_DIR)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DatasetStore()
+        return _store
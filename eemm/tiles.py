@@ -0,0 +1,19 @@
+# --- CAPAS DE TESELAS DEL MAPA ---
+# Una sola definición para el mapa folium (eemm.mapview) y el mapa incremental (ui.live_map).
+
+CARTO_TILES = {
+    "Estándar": 'https://{s}.basemaps.cartocdn.com/rastertiles/voyager/{z}/{x}/{y}{r}.png',
+    "Escala de Grises": 'https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png',
+    "Azul Oscuro": 'https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png',
+}
+SATELLITE_TILES = 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}'
+SATELLITE_LABELS = 'https://{s}.basemaps.cartocdn.com/rastertiles/voyager_only_labels/{z}/{x}/{y}{r}.png'
+
+
+def tile_layers(tipo_vista="Callejero", estilo_mapa="Estándar"):
+    """Capas base (y de etiquetas) de la vista elegida, en orden de apilado."""
+    if tipo_vista == "Callejero":
+        return [{'url': CARTO_TILES.get(estilo_mapa, CARTO_TILES["Azul Oscuro"]), 'attr': 'CartoDB', 'name': 'Callejero', 'overlay': False}]
+    # Satélite
+    return [{'url': SATELLITE_TILES, 'attr': 'Esri', 'name': 'Satélite Base', 'overlay': False},
+            {'url': SATELLITE_LABELS, 'attr': 'CartoDB', 'name': 'Etiquetas Limpias', 'overlay': True}]
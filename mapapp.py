@@ -1,18 +1,22 @@
 import streamlit as st
 import pandas as pd
-import folium
-from streamlit_folium import st_folium
-import io
-import zipfile
-
-# Protección por si matplotlib no está instalado en el servidor
-try:
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    MATPLOTLIB_INSTALLED = True
-except ImportError:
-    MATPLOTLIB_INSTALLED = False
+import uuid
+from functools import partial
+
+from eemm.aggregate import aggregate_promotions
+from eemm.cube import PricingCube
+from eemm.comparables import GeoIndex, parse_point, query_comparables
+from eemm.facets import FACETS, FacetIndex, mask_digest
+from eemm.fichas import MATPLOTLIB_INSTALLED, write_pdf, write_zip
+from eemm.geocode import default_geocoder
+from eemm.ingest import content_hash, load_dataset
+from eemm.instrument import RerunProfiler, RunTimer, deferred_records, enable_logging, env_enabled, log_event
+from eemm.markers import frame_marker_records
+from eemm.pyramid import DETAIL_ZOOM, MIN_MARKERS, GridPyramid, pyramid_levels
+from eemm.store import get_store
+from eemm.tiles import tile_layers
+from ui.card_panel import VIRTUAL_PANEL_AVAILABLE, card_panel
+from ui.live_map import LIVE_MAP_AVAILABLE, live_map
 
 # --- CONFIGURACIÓN DE PÁGINA Y MEMORIA ---
 st.set_page_config(page_title="Estudio de Mercado Pro", layout="wide", initial_sidebar_state="collapsed")
@@ -24,6 +28,21 @@ if 'reset_key' not in st.session_state:
 if 'do_filter_view' not in st.session_state:
     st.session_state.do_filter_view = False
 
+# --- INSTRUMENTACIÓN (EEMM_PROFILE=1 o ?perf=1 en la URL) ---
+PERF_ENABLED = env_enabled() or st.query_params.get('perf') == '1'
+# La sesión identifica las descargas medidas en otro hilo tras el rerun (deferred_records)
+perf = RunTimer(enabled=PERF_ENABLED, session=st.session_state.setdefault('perf_session', uuid.uuid4().hex[:8]))
+rerun_profiler = None
+if PERF_ENABLED:
+    enable_logging()
+    # Un rerun interrumpido (st.rerun) puede dejar un perfilador activo
+    stale = st.session_state.pop('perf_profiler', None)
+    if stale is not None:
+        stale.stop()
+    if st.session_state.pop('profile_next', False):
+        rerun_profiler = st.session_state.perf_profiler = RerunProfiler()
+        rerun_profiler.start()
+
 # --- ESTILOS CSS TEMA OSCURO ---
 st.markdown("""
 <style>
@@ -95,137 +114,46 @@ div.stButton > button:hover { border-color: #3a86ff; color: #ffffff; background-
 st.markdown('<div class="app-header"><p class="app-title">ESTUDIO DE MERCADO PRO</p><p style="font-size:11px; color:#b0b0b0; margin:0;">Análisis de Entorno & Pricing</p></div>', unsafe_allow_html=True)
 
 # --- LÓGICA DE DATOS Y EXPORTACIÓN ---
-@st.cache_data
+def dataset_key(file):
+    # Hash del contenido, calculado una vez por fichero subido en esta sesión
+    keys = st.session_state.setdefault('dataset_keys', {})
+    if file.file_id not in keys:
+        keys[file.file_id] = content_hash(file.getvalue())
+    return keys[file.file_id]
+
 def load_data(file):
     try:
-        xls = pd.ExcelFile(file)
-        df = pd.read_excel(xls, sheet_name='EEMM')
-        df.columns = [str(c).strip().upper() for c in df.columns]
-        
-        c = {
-            'coord': next((x for x in df.columns if 'COORD' in x), None),
-            'ref': next((x for x in df.columns if 'REF' in x), None),
-            'nombre': next((x for x in df.columns if any(k in x for k in ['PROMOCI', 'NOMBRE', 'PROYECTO'])), None),
-            'vrm': 'VRM SCIC', 'pvp': 'PVP', 'tipo': next((x for x in df.columns if 'TIPOLOGI' in x), None),
-            'tier': 'TIER', 'zona': 'ZONA', 'ciudad': next((x for x in df.columns if 'CIUDAD' in x), None),
-            'planta': 'PLANTA', 'dorm': 'Nº DORM'
-        }
-        if not c['ref']: c['ref'] = c['nombre']
-        if not c['nombre']: c['nombre'] = c['ref']
-
-        if c['coord']:
-            coords = df[c['coord']].astype(str).str.replace(' ', '').str.split(',', expand=True)
-            df['lat'] = pd.to_numeric(coords[0], errors='coerce')
-            df['lon'] = pd.to_numeric(coords[1], errors='coerce')
-            return df.dropna(subset=['lat', 'lon']), c
-        return pd.DataFrame(), {}
+        # Almacén compartido entre sesiones (mismo libro = un solo parseo y una sola copia en memoria);
+        # debajo, copia columnar en disco + índice de facetas (ver eemm.ingest). El resultado es de solo lectura.
+        # Las filas sin COORD se geocodifican por dirección si hay cliente configurado (ver eemm.geocode).
+        return get_store().get_or_load(dataset_key(file), lambda: load_dataset(file.getvalue(), geocoder=default_geocoder()))
     except Exception as e: 
         st.error(f"Error al procesar: {e}")
-        return pd.DataFrame(), {}
-
-def clean_dorm(x):
-    items = set()
-    for i in x.dropna():
-        s = str(i).replace('.0', '').strip().upper()
-        if s:
-            if not s.endswith('D'): s += 'D'
-            items.add(s)
-    return "-".join(sorted(list(items)))
-
-def generate_zip_images(df, cols):
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for idx, row in df.iterrows():
-            ref = str(row[cols['ref']])
-            nombre = str(row.get(cols['nombre'], ref))
-            if nombre.lower() in ['nan', 'none', '']: nombre = ref
-            
-            uds = row['UDS']
-            pvp = row.get(cols['pvp'], 0)
-            vrm = row.get(cols['vrm'], 0)
-            tipos = row.get(cols['dorm'], 'N/A')
-            
-            fig, ax = plt.subplots(figsize=(5.6, 1.8), dpi=200)
-            ax.axis('off')
-            
-            ax.add_patch(plt.Rectangle((0, 0), 1, 1, facecolor='#ffffff', edgecolor='#cccccc', linewidth=2, transform=ax.transAxes))
-            ax.add_patch(plt.Rectangle((0, 0), 0.02, 1, facecolor='#3a86ff', transform=ax.transAxes))
-            
-            ax.text(0.05, 0.72, f"{ref} - {nombre}", fontsize=14, fontweight='heavy', color='#003366', transform=ax.transAxes)
-            ax.text(0.05, 0.40, "Unidades:", fontsize=11, fontweight='bold', color='#666666', transform=ax.transAxes)
-            ax.text(0.25, 0.40, f"{uds}", fontsize=12, fontweight='bold', color='#121212', transform=ax.transAxes)
-            ax.text(0.48, 0.40, "PVP Medio:", fontsize=11, fontweight='bold', color='#666666', transform=ax.transAxes)
-            ax.text(0.72, 0.40, f"{pvp:,.0f} €", fontsize=12, fontweight='bold', color='#121212', transform=ax.transAxes)
-            ax.text(0.05, 0.15, "Unitario:", fontsize=11, fontweight='bold', color='#666666', transform=ax.transAxes)
-            ax.text(0.25, 0.15, f"{vrm:,.0f} €/m²", fontsize=12, fontweight='bold', color='#121212', transform=ax.transAxes)
-            ax.text(0.48, 0.15, "Tipologías:", fontsize=11, fontweight='bold', color='#666666', transform=ax.transAxes)
-            ax.text(0.72, 0.15, f"{tipos}", fontsize=12, fontweight='bold', color='#121212', transform=ax.transAxes)
-            
-            img_buf = io.BytesIO()
-            plt.savefig(img_buf, format='png', bbox_inches='tight', pad_inches=0.02)
-            plt.close(fig)
-            img_buf.seek(0)
-            
-            zip_file.writestr(f"Ficha_{ref}.png", img_buf.read())
-            
-    zip_buffer.seek(0)
-    return zip_buffer
-
-# --- FUNCIÓN GENERADORA DE ETIQUETAS INTERACTIVAS (JS NATIVO) ---
-def build_smart_marker_html(ref_str, val_vrm, direction, show_price):
-    if not show_price:
-        return f"""
-        <div style="drop-shadow: 0 2px 4px rgba(0,0,0,0.6); font-family: Arial, sans-serif;">
-            <div style="background-color: #3a86ff; color: white; border-radius: 12px; min-width: 26px; height: 20px; 
-                        display: flex; justify-content: center; align-items: center; font-size: 10px; 
-                        font-weight: bold; border: 1.5px solid white; padding: 0 4px;">
-                {ref_str}
-            </div>
-        </div>
-        """
-        
-    # Inicialización basada en el algoritmo Python
-    if direction == "right":
-        align_style = "left: 15px;"
-        pad_style = "1px 6px 1px 12px"
-    else:
-        align_style = "right: 15px;"
-        pad_style = "1px 12px 1px 6px"
-    
-    # ¡LA MAGIA JAVASCRIPT! Permite hacer click para cambiar el lado al vuelo
-    js_code = """
-    var p = this.querySelector('.tag-price');
-    if (p.style.left) {
-        p.style.left = '';
-        p.style.right = '15px';
-        p.style.padding = '1px 12px 1px 6px';
-    } else {
-        p.style.right = '';
-        p.style.left = '15px';
-        p.style.padding = '1px 6px 1px 12px';
-    }
-    event.stopPropagation();
-    """
-    
-    return f"""
-    <div style="position: relative; width: 26px; height: 20px; font-family: Arial, sans-serif; cursor: pointer;" onclick="{js_code}">
-        <div class="tag-price" style="position: absolute; {align_style} top: 0px; background-color: white; 
-                    border: 1.5px solid #3a86ff; border-radius: 4px; padding: {pad_style}; 
-                    font-size: 10px; font-weight: bold; color: #121212; white-space: nowrap; z-index: 1; transition: all 0.25s ease;">
-            {val_vrm:,.0f} €/m²
-        </div>
-        <div style="position: absolute; left: 0; top: 0; background-color: #3a86ff; color: white; border-radius: 12px;
-                    min-width: 26px; height: 20px; display: flex; justify-content: center; align-items: center;
-                    font-size: 10px; font-weight: bold; border: 1.5px solid white; z-index: 2; padding: 0 4px;">
-            {ref_str}
-        </div>
-    </div>
-    """
+        return pd.DataFrame(), {}, FacetIndex({}, {}, 0)
+
+ETIQUETAS_FACETA = {'tipo': "Tipología", 'tier': "Tier", 'zona': "Zona", 'ciudad': "Ciudad", 'planta': "Planta", 'dorm': "Dormitorios"}
+
+def export_bytes(writer, df, cols):
+    # El export se escribe ficha a ficha en un temporal (a disco si crece); st.download_button
+    # necesita bytes, así que sólo el archivo final pasa por memoria, una vez.
+    with writer(df, cols) as fh:
+        return fh.read()
+
+@st.cache_data(max_entries=32)
+def aggregate_data(_df_filtered, dataset_id, mask_key, cols):
+    return aggregate_promotions(_df_filtered, cols)
+
+@st.cache_data(max_entries=32)
+def marker_data(_df_promo, dataset_id, promo_key, cols):
+    # Colocación sobre todas las promociones filtradas (no sólo las visibles): ocultar una
+    # no mueve las demás, así que en el mapa incremental ocultar es sólo un diff de REF
+    return frame_marker_records(_df_promo, cols)
 
 # --- LAYOUT DE COLUMNAS ---
 col_izq, col_mapa, col_der, col_ctrl = st.columns([1.1, 4, 1.1, 1.1])
 
 df_final = pd.DataFrame()
+origen_comp = None
 ALTURA_CONTENEDOR = 820 
 
 # --- PANEL DERECHO (CONTROL Y FILTROS) ---
@@ -236,6 +164,11 @@ with col_ctrl:
         
         if file:
             mostrar_etiquetas = st.toggle("Ver Precios", value=True)
+            panel_virtual = st.toggle("Panel virtual", value=True, help="Lista de tarjetas con scroll virtual (sólo se pintan las visibles)") if VIRTUAL_PANEL_AVAILABLE else False
+            mapa_incremental = st.toggle("Mapa incremental", value=True, help="El mapa se queda en el navegador y cada cambio sólo envía diferencias: se conservan zoom y encuadre") if LIVE_MAP_AVAILABLE else False
+            capa_ligera = st.toggle("Capa ligera", value=True, disabled=mapa_incremental, help="Envía los marcadores como datos y monta las etiquetas en el navegador (recomendado con muchas promociones)")
+            vista_agregada = st.toggle("Agregar por zoom", value=True, disabled=not (capa_ligera or mapa_incremental),
+                                       help=f"Con {MIN_MARKERS}+ promociones, los zooms alejados muestran celdas (uds, VRM mediana, PVP medio) en lugar de marcadores")
             
             st.markdown("<p style='font-size:10px; font-weight:bold; margin-bottom:4px; margin-top:5px; color:#a0a0a0;'>MAPA</p>", unsafe_allow_html=True)
             c_map1, c_map2 = st.columns(2)
@@ -258,49 +191,78 @@ with col_ctrl:
 
             st.markdown("---")
 
-            df_raw, cols = load_data(file)
+            with perf.stage('ingesta') as stage:
+                df_raw, cols, facets = load_data(file)
+                stage['rows'] = len(df_raw)
             if not df_raw.empty:
-                def mk_filter(lbl, col_name, f_key):
-                    if col_name and col_name in df_raw.columns:
-                        opts = sorted(df_raw[col_name].dropna().unique().astype(str))
-                        return st.multiselect(lbl, opts, default=opts, key=f"{f_key}_{st.session_state.reset_key}")
-                    return []
+                # Selección vigente (ya actualizada por Streamlit antes del rerun) para los conteos en vivo
+                sel_actual = {f: st.session_state.get(f"{f}_{st.session_state.reset_key}") for f in FACETS if f in facets}
+                conteos = facets.live_counts(sel_actual)
+
+                def mk_filter(lbl, f_key):
+                    if f_key in facets:
+                        opts = facets.options(f_key)
+                        totales = facets.totals(f_key)
+                        vivos = " · ".join(f"{o}: {conteos[f_key][o]}" for o in opts)
+                        return st.multiselect(lbl, opts, default=opts, key=f"{f_key}_{st.session_state.reset_key}",
+                                              format_func=lambda o: f"{o} ({totales[o]})",
+                                              help=f"Uds. con el resto de filtros → {vivos}")
+                    return None
                 
-                f_tipo = mk_filter("Tipología", cols['tipo'], "tipo")
+                f_sel = {}
+                f_sel['tipo'] = mk_filter("Tipología", "tipo")
                 st.markdown("<div style='height: 5px;'></div>", unsafe_allow_html=True)
-                f_tier = mk_filter("Tier", cols['tier'], "tier")
+                f_sel['tier'] = mk_filter("Tier", "tier")
                 st.markdown("<div style='height: 5px;'></div>", unsafe_allow_html=True)
-                f_zona = mk_filter("Zona", cols['zona'], "zona")
+                f_sel['zona'] = mk_filter("Zona", "zona")
                 st.markdown("<div style='height: 5px;'></div>", unsafe_allow_html=True)
-                f_ciudad = mk_filter("Ciudad", cols['ciudad'], "ciudad")
+                f_sel['ciudad'] = mk_filter("Ciudad", "ciudad")
                 st.markdown("<div style='height: 5px;'></div>", unsafe_allow_html=True)
-                f_planta = mk_filter("Planta", cols['planta'], "planta")
+                f_sel['planta'] = mk_filter("Planta", "planta")
                 st.markdown("<div style='height: 5px;'></div>", unsafe_allow_html=True)
-                f_dorm = mk_filter("Dormitorios", cols['dorm'], "dorm")
-
-                mask = pd.Series(True, index=df_raw.index)
-                if cols['tipo']: mask &= df_raw[cols['tipo']].astype(str).isin(f_tipo)
-                if cols['tier']: mask &= df_raw[cols['tier']].astype(str).isin(f_tier)
-                if cols['zona']: mask &= df_raw[cols['zona']].astype(str).isin(f_zona)
-                if cols['ciudad']: mask &= df_raw[cols['ciudad']].astype(str).isin(f_ciudad)
-                if cols['planta']: mask &= df_raw[cols['planta']].astype(str).isin(f_planta)
-                if cols['dorm']: mask &= df_raw[cols['dorm']].astype(str).isin(f_dorm)
-                
-                df_filtered = df_raw[mask]
+                f_sel['dorm'] = mk_filter("Dormitorios", "dorm")
+
+                with perf.stage('filtros') as stage:
+                    mask = facets.mask(f_sel)
+                    df_filtered = df_raw[mask]
+                    stage['rows'] = len(df_filtered)
                 
                 if not df_filtered.empty:
-                    agg_rules = {
-                        'lat':'first', 'lon':'first', 
-                        cols['vrm']:'median' if cols['vrm'] in df_filtered.columns else 'first',
-                        cols['pvp']:'mean' if cols['pvp'] in df_filtered.columns else 'first'
-                    }
-                    if cols['nombre'] and cols['nombre'] != cols['ref']:
-                        agg_rules[cols['nombre']] = 'first'
-                    if cols['dorm']: agg_rules[cols['dorm']] = clean_dorm
-                    
-                    df_promo = df_filtered.groupby(cols['ref']).agg(agg_rules).reset_index()
-                    counts = df_filtered.groupby(cols['ref']).size().reset_index(name='UDS')
-                    df_promo = pd.merge(df_promo, counts, on=cols['ref'])
+                    # Memoizada por fichero + filas filtradas: cambiar estilo o precios no reagrega
+                    with perf.stage('agregacion') as stage:
+                        df_promo = aggregate_data(df_filtered, dataset_key(file), mask_digest(mask), cols)
+                        stage['rows'] = len(df_promo)
+                    clave_promos = mask_digest(mask)
+
+                    # --- COMPARABLES (K MÁS CERCANOS / RADIO, DISTANCIA HAVERSINE) ---
+                    with st.expander("Comparables"):
+                        comp_activo = st.toggle("Filtrar comparables", value=False)
+                        origen = st.radio("Origen", ["REF", "Punto"], horizontal=True)
+                        ref_origen, punto = None, None
+                        if origen == "REF":
+                            ref_origen = st.selectbox("REF de origen", df_promo[cols['ref']].astype(str).tolist())
+                        else:
+                            punto = parse_point(st.text_input("Coordenadas (lat, lon)", placeholder="40.4168, -3.7038"))
+                        criterio = st.radio("Criterio", ["K más cercanos", "Radio (m)"], horizontal=True)
+                        if criterio == "K más cercanos":
+                            k_comp, radio_comp = st.number_input("K", min_value=1, max_value=500, value=10), None
+                        else:
+                            k_comp, radio_comp = None, st.number_input("Radio (m)", min_value=50, max_value=50000, value=1000, step=50)
+
+                    if comp_activo and (ref_origen or punto):
+                        with perf.stage('comparables') as stage:
+                            geo = get_store().get_or_load(f"{dataset_key(file)}:geo", lambda: GeoIndex.from_frame(df_raw, cols))
+                            refs_promo = df_promo[cols['ref']].astype(str)
+                            comp = query_comparables(geo, ref=ref_origen, point=punto, k=k_comp, radius_m=radio_comp, allowed_refs=refs_promo)
+                            dist = comp.set_index('ref')['dist_m']
+                            # DIST_M sobre las REF del frame ya filtrado: con 0 comparables queda vacío, sin filas NaN
+                            df_promo = df_promo[refs_promo.isin(dist.index)]
+                            df_promo = df_promo.assign(DIST_M=df_promo[cols['ref']].astype(str).map(dist).round(0)).sort_values('DIST_M')
+                            origen_comp = (punto or geo.locate(ref_origen)) + (radio_comp,)
+                            clave_promos += f"|{ref_origen}|{punto}|{k_comp}|{radio_comp}"
+                            stage['rows'] = len(df_promo)
+                        if df_promo.empty:
+                            st.info("Sin comparables para ese origen y criterio.")
                     
                     df_visible = df_promo[~df_promo[cols['ref']].astype(str).isin(st.session_state.hidden_promos)]
                     df_ocultos = df_promo[df_promo[cols['ref']].astype(str).isin(st.session_state.hidden_promos)]
@@ -308,14 +270,21 @@ with col_ctrl:
                     st.markdown("---")
                     
                     if MATPLOTLIB_INSTALLED:
-                        zip_data = generate_zip_images(df_visible, cols)
+                        # Generación diferida y en streaming: sólo se pintan las fichas al pulsar el botón
                         st.download_button(
                             label="Descargar Fichas PNG (.zip)",
-                            data=zip_data,
+                            data=perf.timed('fichas_zip', partial(export_bytes, write_zip, df_visible, cols), rows=len(df_visible)),
                             file_name="fichas_comparables.zip",
                             mime="application/zip",
                             use_container_width=True
                         )
+                        st.download_button(
+                            label="Descargar Informe PDF",
+                            data=perf.timed('fichas_pdf', partial(export_bytes, write_pdf, df_visible, cols), rows=len(df_visible)),
+                            file_name="fichas_comparables.pdf",
+                            mime="application/pdf",
+                            use_container_width=True
+                        )
 
                     st.markdown("---")
                     with st.expander(f"Ocultos ({len(df_ocultos)})"):
@@ -388,85 +357,78 @@ if file and not df_filtered.empty:
         mid = TOTAL_CARDS // 2 + (TOTAL_CARDS % 2)
         left_df, right_df = df_visible.iloc[:mid], df_visible.iloc[mid:]
 
-    with col_izq:
-        with st.container(height=ALTURA_CONTENEDOR, border=False):
-            st.markdown("<div style='height: 5px;'></div>", unsafe_allow_html=True)
-            for _, row in left_df.iterrows(): render_promo_card(row, "left")
+    with perf.stage('tarjetas', rows=TOTAL_CARDS):
+        if panel_virtual:
+            # Un componente por columna: el coste del rerun no depende del número de tarjetas
+            for col_panel, panel_df, side in [(col_izq, left_df, "left"), (col_der, right_df, "right")]:
+                with col_panel:
+                    ref_oculta = card_panel(panel_df, cols, side, ALTURA_CONTENEDOR - 10, key=f"cards_{side}")
+                    if ref_oculta:
+                        st.session_state.hidden_promos.add(ref_oculta)
+                        st.rerun()
+        else:
+            with col_izq:
+                with st.container(height=ALTURA_CONTENEDOR, border=False):
+                    st.markdown("<div style='height: 5px;'></div>", unsafe_allow_html=True)
+                    for _, row in left_df.iterrows(): render_promo_card(row, "left")
 
-    with col_der:
-        with st.container(height=ALTURA_CONTENEDOR, border=False):
-            st.markdown("<div style='height: 5px;'></div>", unsafe_allow_html=True)
-            for _, row in right_df.iterrows(): render_promo_card(row, "right")
+            with col_der:
+                with st.container(height=ALTURA_CONTENEDOR, border=False):
+                    st.markdown("<div style='height: 5px;'></div>", unsafe_allow_html=True)
+                    for _, row in right_df.iterrows(): render_promo_card(row, "right")
 
-    # MAPA NATIVO (100% FLUIDO Y ESTABLE)
     with col_mapa:
-        m = folium.Map(tiles=None, control_scale=False, zoom_control=True)
-        
-        if tipo_vista == "Callejero":
-            if estilo_mapa == "Estándar":
-                tiles_url = 'https://{s}.basemaps.cartocdn.com/rastertiles/voyager/{z}/{x}/{y}{r}.png'
-            elif estilo_mapa == "Escala de Grises":
-                tiles_url = 'https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png'
-            else: 
-                tiles_url = 'https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png'
-            folium.TileLayer(tiles=tiles_url, attr='CartoDB', name='Callejero', overlay=False).add_to(m)
-        else: # Satélite
-            folium.TileLayer(
-                tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
-                attr='Esri', name='Satélite Base', overlay=False
-            ).add_to(m)
-            folium.TileLayer(
-                tiles='https://{s}.basemaps.cartocdn.com/rastertiles/voyager_only_labels/{z}/{x}/{y}{r}.png',
-                attr='CartoDB', name='Etiquetas Limpias', overlay=True
-            ).add_to(m)
-
-        if not df_visible.empty:
-            sw, ne = df_visible[['lat', 'lon']].min().values.tolist(), df_visible[['lat', 'lon']].max().values.tolist()
-            m.fit_bounds([sw, ne])
-            
-            # Algoritmo Base de separación (pre-asigna derecha/izquierda inicial)
-            processed_markers = []
-            CLUSTER_THRESHOLD = 0.0025 
-            
-            for i, row in df_visible.iterrows():
-                ref_str = str(row[cols['ref']])
-                val_vrm = row.get(cols['vrm'], 0)
-                current_lat = row['lat']
-                current_lon = row['lon']
-                
-                direction = "right" 
-                lat_offset = 0
-                lon_offset = 0
-                
-                neighbors = []
-                for p in processed_markers:
-                    dist = ((current_lat - p['lat'])**2 + (current_lon - p['lon'])**2)**0.5
-                    if dist < CLUSTER_THRESHOLD:
-                        neighbors.append(p)
-                
-                if neighbors:
-                    dirs_taken = [n['dir'] for n in neighbors]
-                    if "right" in dirs_taken and "left" not in dirs_taken:
-                        direction = "left" 
-                    elif "right" in dirs_taken and "left" in dirs_taken:
-                        direction = "right" if len(neighbors) % 2 == 0 else "left"
-                        lat_offset = 0.0004 * len(neighbors) 
-                        lon_offset = 0.0004 * len(neighbors) 
-                
-                final_lat = current_lat + lat_offset
-                final_lon = current_lon + lon_offset
-                processed_markers.append({'lat': final_lat, 'lon': final_lon, 'dir': direction})
-                
-                # Construimos el marcador mágico interactivo
-                marker_html = build_smart_marker_html(ref_str, val_vrm, direction, mostrar_etiquetas)
-                
-                folium.Marker(
-                    [final_lat, final_lon], 
-                    icon=folium.DivIcon(html=marker_html, icon_anchor=(13, 10)) 
-                ).add_to(m)
-
-        # PARÁMETRO VITAL: Prohíbe la recarga del mapa al mover el ratón.
-        st_folium(m, width="100%", height=ALTURA_CONTENEDOR, key="main_map", returned_objects=[])
+        tab_mapa, tab_precios = st.tabs(["Mapa", "Precios"])
+
+    with tab_mapa:
+        piramide = None
+        if (capa_ligera or mapa_incremental) and vista_agregada and len(df_visible) >= MIN_MARKERS:
+            # Pirámide construida una vez por dataset; cada rerun sólo resume las filas filtradas y visibles
+            with perf.stage('piramide', rows=len(df_visible)):
+                pyr = get_store().get_or_load(f"{dataset_key(file)}:pyramid", lambda: GridPyramid.from_frame(df_raw, cols))
+                piramide = pyr.summarize(mask, df_visible[cols['ref']])
+
+        if mapa_incremental:
+            # Mapa persistente en el navegador: sólo viajan los bloques cuya huella cambia
+            with perf.stage('marcadores', rows=len(df_promo)):
+                registros = marker_data(df_promo, dataset_key(file), clave_promos, cols)
+            with perf.stage('live_map', rows=len(df_visible)):
+                live_map(registros, hidden=st.session_state.hidden_promos, show_price=mostrar_etiquetas,
+                         tiles=tile_layers(tipo_vista, estilo_mapa), subject=origen_comp,
+                         pyramid=pyramid_levels(piramide) if piramide else None, detail_zoom=DETAIL_ZOOM,
+                         height=ALTURA_CONTENEDOR - 45, key="live_map")
+        else:
+            # MAPA NATIVO (100% FLUIDO Y ESTABLE) — folium se importa sólo cuando hay algo que pintar
+            from streamlit_folium import st_folium
+            from eemm.mapview import build_map
+
+            with perf.stage('marcadores', rows=len(df_visible)):
+                m = build_map(df_visible, cols, mostrar_etiquetas, tipo_vista, estilo_mapa, light=capa_ligera, subject=origen_comp, pyramid=piramide)
+
+            # PARÁMETRO VITAL: Prohíbe la recarga del mapa al mover el ratón.
+            with perf.stage('st_folium', rows=len(df_visible)):
+                st_folium(m, width="100%", height=ALTURA_CONTENEDOR - 45, key="main_map", returned_objects=[])
+
+    # CUBO DE PRECIOS: se construye una vez por dataset y cada cambio de filtros sólo lo re-corta
+    with tab_precios:
+        with perf.stage('cubo') as stage:
+            cubo = get_store().get_or_load(f"{dataset_key(file)}:cube", lambda: PricingCube.from_frame(df_raw, cols, facets))
+            c_desglose, c_medida = st.columns([3, 1])
+            with c_desglose:
+                por = st.multiselect("Desglose", list(cubo.dims), default=[d for d in ('zona', 'tipo') if d in cubo.dims],
+                                     format_func=ETIQUETAS_FACETA.get)
+            with c_medida:
+                medida = st.radio("Medida", ["VRM SCIC (€/m²)", "PVP (€)"], label_visibility="collapsed")
+            prefijo = 'VRM' if medida.startswith('VRM') else 'PVP'
+            tabla = cubo.slice(f_sel, by=por, exclude_refs=st.session_state.hidden_promos)
+            distribucion = cubo.distribution(f_sel, prefijo.lower(), exclude_refs=st.session_state.hidden_promos)
+            stage['rows'] = len(tabla)
+
+        columnas = por + ['UDS'] + [c for c in tabla.columns if c.startswith(f"{prefijo}_")]
+        st.dataframe(tabla[columnas].round(0).rename(columns={d: cols[d] for d in por}),
+                     hide_index=True, use_container_width=True, height=ALTURA_CONTENEDOR - 340)
+        st.caption("Filtros y ocultos aplicados (no el filtro de comparables). Percentiles con error relativo ≤ 1%.")
+        st.bar_chart(distribucion, x='desde', y='uds', height=220, x_label=medida, y_label="Uds")
 
 else:
     with col_mapa:
@@ -485,3 +447,33 @@ else:
             </div>
         </div>
         """, unsafe_allow_html=True)
+
+# --- PANEL DE RENDIMIENTO (OCULTO) ---
+if PERF_ENABLED:
+    if rerun_profiler is not None:
+        st.session_state.profile_result = rerun_profiler.stop()
+        st.session_state.pop('perf_profiler', None)
+    with col_ctrl:
+        with st.expander(f"Rendimiento · {perf.total_ms():,.0f} ms"):
+            if perf.records:
+                st.dataframe(pd.DataFrame(perf.records).drop(columns=['run']), hide_index=True, use_container_width=True)
+            exportaciones = deferred_records(perf.session)
+            if exportaciones:
+                st.caption("Exportaciones (se generan al pulsar la descarga, después del rerun)")
+                st.dataframe(pd.DataFrame(exportaciones), hide_index=True, use_container_width=True)
+            if st.button("Perfilar siguiente rerun", use_container_width=True):
+                st.session_state.profile_next = True
+                st.rerun()
+            store_stats = get_store().stats()
+            log_event('store', run=perf.run_id, **store_stats)
+            st.caption("Almacén de datasets")
+            st.json(store_stats, expanded=False)
+            if file and df_raw.attrs.get('memoria'):
+                st.caption("Memoria del dataset (compactado en la ingesta)")
+                st.json(df_raw.attrs['memoria'], expanded=False)
+            perfil = st.session_state.get('profile_result')
+            if perfil is not None:
+                st.download_button("Descargar perfil (.pstats)", perfil.pstats_bytes, file_name="rerun.pstats",
+                                   mime="application/octet-stream", use_container_width=True)
+                st.download_button("Descargar perfil (.txt)", perfil.text, file_name="rerun_profile.txt",
+                                   mime="text/plain", use_container_width=True)
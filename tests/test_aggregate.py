@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from eemm.aggregate import aggregate_promotions
+
+COLS = {'ref': 'REF', 'vrm': 'VRM', 'pvp': 'PVP', 'nombre': 'NOMBRE', 'dorm': 'DORM'}
+
+
+def clean_dorm(x):
+    # Versión original (por grupo, en Python) contra la que se compara la vectorizada
+    items = set()
+    for i in x.dropna():
+        s = str(i).replace('.0', '').strip().upper()
+        if s:
+            if not s.endswith('D'): s += 'D'
+            items.add(s)
+    return "-".join(sorted(list(items)))
+
+
+def baseline(df, cols):
+    agg_rules = {'lat': 'first', 'lon': 'first', cols['vrm']: 'median', cols['pvp']: 'mean',
+                 cols['nombre']: 'first', cols['dorm']: clean_dorm}
+    df_promo = df.groupby(cols['ref'], observed=True).agg(agg_rules).reset_index()
+    counts = df.groupby(cols['ref'], observed=True).size().reset_index(name='UDS')
+    return pd.merge(df_promo, counts, on=cols['ref'])
+
+
+def frame(rows=400, promos=40, seed=0):
+    rng = np.random.default_rng(seed)
+    promo = rng.integers(0, promos, rows)
+    return pd.DataFrame({
+        'REF': promo.astype(float) + 1,
+        'lat': 40 + promo / 100,
+        'lon': -3 - promo / 100,
+        'VRM': rng.normal(3000, 500, rows),
+        'PVP': rng.normal(300000, 50000, rows),
+        'NOMBRE': [f"P{p}" for p in promo],
+        'DORM': rng.choice(np.array([1, 2, 3, '4D', ' 2 ', None], dtype=object), rows),
+    })
+
+
+@pytest.mark.parametrize('ref_kind', ['float', 'object', 'category'])
+def test_matches_baseline_with_blank_refs(ref_kind):
+    df = frame()
+    df.loc[[3, 50, 51], 'REF'] = np.nan
+    if ref_kind == 'float':
+        df['REF'] = df['REF'].astype(np.float32)   # como llega de load_dataset (compact_frame)
+    elif ref_kind == 'object':
+        df['REF'] = df['REF'].map(lambda r: None if pd.isna(r) else f"{r:.0f}").astype(object)
+    elif ref_kind == 'category':
+        df['REF'] = df['REF'].astype('category')
+
+    ours = aggregate_promotions(df, COLS)
+    expected = baseline(df, COLS)
+
+    assert list(ours.columns) == list(expected.columns)
+    assert ours['REF'].notna().all()
+    for col in expected.columns:
+        if col in ('lat', 'lon', 'VRM', 'PVP'):
+            np.testing.assert_allclose(ours[col].to_numpy(float), expected[col].to_numpy(float))
+        else:
+            assert ours[col].astype(str).tolist() == expected[col].astype(str).tolist(), col
+
+
+def test_categorical_dorm_column():
+    df = frame(seed=1)
+    df['DORM'] = df['DORM'].astype(str).replace('None', np.nan).astype('category')
+    df.loc[0, 'REF'] = np.nan
+    ours = aggregate_promotions(df, COLS)
+    expected = baseline(df, COLS)
+    assert ours['DORM'].tolist() == expected['DORM'].tolist()
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+import eemm.geocode as geocode
+from benchmarks.synthetic import synthetic_frame, synthetic_workbook
+from eemm.geocode import StubGeocoder, shared_limiter
+from eemm.ingest import load_dataset
+
+
+def stub_table(seed):
+    # Cada dirección de la hoja sintética -> una coordenada fija
+    df = synthetic_frame(2000, 80, seed=seed, missing_coord=0.05)
+    addresses = (df['DIRECCIÓN'] + ', ' + df['CIUDAD']).unique()
+    return {a: (40.0 + i / 1000, -3.0 - i / 1000) for i, a in enumerate(addresses)}
+
+
+def test_fills_missing_coords_and_caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(geocode, 'GEOCODE_DB', str(tmp_path / 'geocode.sqlite'))
+    data = synthetic_workbook(2000, 80, seed=3, missing_coord=0.05)
+    table = stub_table(3)
+
+    first = StubGeocoder(table)
+    df, cols, _ = load_dataset(data, str(tmp_path / 'cache'), geocoder=first)
+    assert first.calls > 0
+    assert df['GEOCODED'].any()
+    assert df['lat'].notna().all() and df['lon'].notna().all()
+    geocoded = df[df['GEOCODED']]
+    expected = [table[f"{d}, {c}"] for d, c in zip(geocoded[cols['direccion']].astype(str), geocoded[cols['ciudad']].astype(str))]
+    np.testing.assert_allclose(geocoded[['lat', 'lon']].to_numpy(float), np.array(expected), atol=1e-4)
+
+    # Segunda carga (otro cliente, mismas direcciones): todo sale de la caché SQLite
+    second = StubGeocoder(table)
+    df2, _, _ = load_dataset(data, str(tmp_path / 'cache'), geocoder=second)
+    assert second.calls == 0
+    pd.testing.assert_frame_equal(df.reset_index(drop=True), df2.reset_index(drop=True))
+
+
+def test_limiter_is_shared_per_rate_key():
+    a, b = StubGeocoder({}, qps=5), StubGeocoder({}, qps=5)
+    b.rate_key = a.rate_key
+    assert shared_limiter(a) is shared_limiter(b)
+    assert shared_limiter(a) is not shared_limiter(StubGeocoder({}))
@@ -0,0 +1 @@
+# Componentes de interfaz de Streamlit (la lógica de cálculo vive en eemm)
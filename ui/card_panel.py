@@ -0,0 +1,141 @@
+import math
+
+import streamlit as st
+
+# --- PANEL VIRTUALIZADO DE TARJETAS ---
+# Un único componente por columna en lugar de columns + 2 markdown + botón por tarjeta.
+# El navegador sólo monta en el DOM las tarjetas de la ventana visible (más un margen)
+# y el "✕" devuelve el REF a Python como trigger value.
+
+ROW_HEIGHT = 75   # alto fijo de tarjeta + separación (px), necesario para virtualizar
+OVERSCAN = 4      # tarjetas extra montadas por encima y por debajo de la ventana
+
+_CSS = """
+.panel { height: 100%; overflow-y: auto; position: relative; font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; }
+.spacer { position: relative; width: 100%; }
+.row { position: absolute; left: 0; right: 0; display: flex; align-items: center; gap: 4px; }
+.row.left { flex-direction: row; }
+.row.right { flex-direction: row-reverse; }
+.promo-card {
+    flex: 1; min-width: 0; box-sizing: border-box;
+    background-color: #252525; border: 1px solid #3a3a3a; border-radius: 6px;
+    padding: 8px 10px; transition: all 0.2s;
+    height: 68px; display: flex; flex-direction: column; justify-content: center;
+}
+.promo-card:hover { border-color: #3a86ff; }
+.promo-header { display: flex; align-items: center; gap: 8px; margin-bottom: 4px; padding-right: 5px; }
+.promo-pill-ui {
+    background-color: #3a86ff; color: white; border-radius: 10px;
+    min-width: 26px; height: 18px; display: flex; justify-content: center;
+    align-items: center; font-size: 10px; font-weight: bold; flex-shrink: 0; padding: 0 5px;
+}
+.promo-name {
+    font-weight: 700; color: #ffffff; font-size: 11px; margin: 0;
+    white-space: nowrap; overflow: hidden; text-overflow: ellipsis; width: 100%;
+}
+.promo-details { font-size: 10px; color: #b0b0b0; line-height: 1.3; }
+.promo-details b { color: #ffffff; }
+.btn-micro {
+    height: 16px; width: 16px; min-width: 16px; font-size: 8px; border: 1px solid #444444; border-radius: 50%;
+    padding: 0; color: #777777; background: transparent; cursor: pointer;
+    display: flex; align-items: center; justify-content: center;
+}
+.btn-micro:hover { color: #ff4d4d; border-color: #ff4d4d; background-color: rgba(255,77,77,0.1); }
+"""
+
+_JS = """
+const ROW = %(row)d, OVERSCAN = %(overscan)d;
+
+function esc(s) {
+    return String(s).replace(/[&<>"']/g, (ch) => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[ch]));
+}
+
+function cardHtml(c, side) {
+    const ref = esc(c.ref), nombre = esc(c.nombre);
+    return `<div class="row ${side}" style="top:${c._i * ROW}px">`
+        + `<button class="btn-micro" data-ref="${ref}" title="Ocultar">✕</button>`
+        + `<div class="promo-card"><div class="promo-header"><div class="promo-pill-ui">${ref}</div>`
+        + `<p class="promo-name" title="${nombre}">${nombre}</p></div>`
+        + `<div class="promo-details">Uds: <b>${esc(c.uds)}</b> | <b>${esc(c.vrm)} €/m²</b><br>`
+        + `Med: <b>${esc(c.pvp)}€</b> | Tip: ${esc(c.tipos)}</div></div></div>`;
+}
+
+export default function(component) {
+    const { data, parentElement, setTriggerValue } = component;
+    let st = parentElement.__cardPanel;
+    if (!st) {
+        const panel = document.createElement('div');
+        panel.className = 'panel';
+        const spacer = document.createElement('div');
+        spacer.className = 'spacer';
+        panel.appendChild(spacer);
+        parentElement.appendChild(panel);
+        st = parentElement.__cardPanel = { panel, spacer, cards: [], side: 'right', first: -1, last: -1, frame: 0 };
+
+        st.draw = () => {
+            st.frame = 0;
+            const first = Math.max(0, Math.floor(st.panel.scrollTop / ROW) - OVERSCAN);
+            const last = Math.min(st.cards.length, Math.ceil((st.panel.scrollTop + st.panel.clientHeight) / ROW) + OVERSCAN);
+            if (first === st.first && last === st.last) return;
+            st.first = first; st.last = last;
+            let html = '';
+            for (let i = first; i < last; i++) html += cardHtml(st.cards[i], st.side);
+            st.spacer.innerHTML = html;
+        };
+        panel.addEventListener('scroll', () => { if (!st.frame) st.frame = requestAnimationFrame(st.draw); });
+        panel.addEventListener('click', (e) => {
+            const btn = e.target.closest('.btn-micro');
+            if (btn) st.setTrigger('hidden', btn.getAttribute('data-ref'));
+        });
+    }
+    st.setTrigger = setTriggerValue;
+    st.cards = (data.cards || []).map((c, i) => Object.assign({ _i: i }, c));
+    st.side = data.side;
+    st.panel.style.height = data.height + 'px';
+    st.spacer.style.height = (st.cards.length * ROW) + 'px';
+    st.first = st.last = -1;
+    st.draw();
+}
+""" % {'row': ROW_HEIGHT, 'overscan': OVERSCAN}
+
+# components.v2 (carga sin build, comunicación bidireccional) sólo existe en Streamlit recientes
+try:
+    _card_panel = st.components.v2.component("eemm_card_panel", css=_CSS, js=_JS)
+    VIRTUAL_PANEL_AVAILABLE = True
+except AttributeError:
+    _card_panel = None
+    VIRTUAL_PANEL_AVAILABLE = False
+
+
+def _fmt(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    return f"{value:,.0f}" if not math.isnan(value) else "nan"
+
+
+def card_records(df, cols):
+    """Datos mínimos de cada tarjeta, ya formateados como en render_promo_card."""
+    if df.empty:
+        return []
+    refs = [str(r) for r in df[cols['ref']].tolist()]
+    nombres = df[cols['nombre']].tolist() if cols['nombre'] in df.columns else refs
+    vrms = df[cols['vrm']].tolist() if cols['vrm'] in df.columns else [0] * len(df)
+    pvps = df[cols['pvp']].tolist() if cols['pvp'] in df.columns else [0] * len(df)
+    tipos = df[cols['dorm']].tolist() if cols['dorm'] and cols['dorm'] in df.columns else ['N/A'] * len(df)
+    records = []
+    for ref, nombre, uds, vrm, pvp, tipo in zip(refs, nombres, df['UDS'].tolist(), vrms, pvps, tipos):
+        nombre = str(nombre)
+        if nombre.lower() in ['nan', 'none', '']: nombre = ref
+        records.append({'ref': ref, 'nombre': nombre, 'uds': str(uds), 'vrm': _fmt(vrm), 'pvp': _fmt(pvp), 'tipos': str(tipo)})
+    return records
+
+
+def card_panel(df, cols, side, height, key):
+    """Pinta la lista como un panel virtualizado; devuelve el REF ocultado en este rerun (o None)."""
+    result = _card_panel(
+        data={'cards': card_records(df, cols), 'side': side, 'height': height},
+        key=key, height=height, on_hidden_change=lambda: None,
+    )
+    return result.hidden if result is not None else None
@@ -0,0 +1,222 @@
+import hashlib
+import json
+
+import streamlit as st
+
+from eemm.markers import CELL_JS, MARKER_JS
+
+# --- MAPA INCREMENTAL (LEAFLET CON ESTADO EN EL NAVEGADOR) ---
+# El mapa Leaflet vive en el navegador entre reruns: cada rerun sólo aplica diferencias
+# (mostrar/ocultar marcadores por REF, cambiar teselas, activar/desactivar precios, origen
+# de comparables) sin recrear el mapa, así que el encuadre y el zoom se conservan.
+# Los bloques grandes (marcadores y pirámide) sólo viajan cuando cambia su huella; si el
+# navegador no los tiene (p.ej. el componente se ha vuelto a montar) pide un reenvío.
+
+LEAFLET_CDN = 'https://cdn.jsdelivr.net/npm/leaflet@1.9.4/dist/'
+
+_CSS = """
+.live-map { width: 100%; background: #1e1e1e; border-radius: 6px; }
+.leaflet-div-icon.empty, .empty { background: transparent; border: none; }
+"""
+
+_JS = """
+const LEAFLET = '%(cdn)s';
+let L = null;
+let leafletReady = null;
+
+function loadLeaflet() {
+    if (!leafletReady) leafletReady = import(LEAFLET + 'leaflet-src.esm.js').then((mod) => { L = mod; return mod; });
+    return leafletReady;
+}
+
+%(marker_js)s
+%(cell_js)s
+
+function init(parentElement) {
+    const css = document.createElement('link');
+    css.rel = 'stylesheet';
+    css.href = LEAFLET + 'leaflet.css';
+    const el = document.createElement('div');
+    el.className = 'live-map';
+    parentElement.appendChild(css);
+    parentElement.appendChild(el);
+    const map = L.map(el, { zoomControl: true, attributionControl: true }).setView([40.4168, -3.7038], 6);
+    const st = { el, map, layer: L.layerGroup(), markers: new Map(), tiles: [], tilesKey: null,
+                 digests: {}, showPrice: null, levels: [], groups: [], detailZoom: null, subject: [] };
+    st.sync = () => {
+        const z = map.getZoom();
+        let active = -1;
+        for (let i = 0; i < st.levels.length; i++) {
+            if (z <= st.levels[i][0]) { active = i; break; }
+        }
+        st.groups.forEach((group, i) => {
+            if (i === active) { if (!map.hasLayer(group)) group.addTo(map); }
+            else if (map.hasLayer(group)) map.removeLayer(group);
+        });
+        // Con pirámide, marcadores individuales sólo a partir del zoom de detalle
+        const showMarkers = !st.groups.length || st.detailZoom === null || z >= st.detailZoom;
+        if (showMarkers) { if (!map.hasLayer(st.layer)) st.layer.addTo(map); }
+        else if (map.hasLayer(st.layer)) map.removeLayer(st.layer);
+    };
+    map.on('zoomend', st.sync);
+    return st;
+}
+
+function icon(d, showPrice) {
+    return L.divIcon({ className: 'empty', html: eemmMarkerHtml(d, showPrice), iconAnchor: [13, 10] });
+}
+
+function setTiles(st, tiles) {
+    if (st.tilesKey === tiles.key) return;
+    st.tiles.forEach((t) => st.map.removeLayer(t));
+    st.tiles = tiles.layers.map((t) => L.tileLayer(t.url, { attribution: t.attr, maxZoom: 20 }).addTo(st.map));
+    st.tiles.forEach((t, i) => t.setZIndex(i));
+    st.tilesKey = tiles.key;
+}
+
+function setRecords(st, records) {
+    st.layer.clearLayers();
+    st.markers = new Map();
+    for (const d of records) {
+        const marker = L.marker([d[1], d[2]], { icon: icon(d, st.showPrice) });
+        marker.eemmData = d;
+        if (st.showPrice) marker.on('click', eemmFlip);
+        st.markers.set(String(d[0]), marker);
+    }
+}
+
+function setPrice(st, showPrice) {
+    if (st.showPrice === showPrice) return;
+    st.showPrice = showPrice;
+    for (const marker of st.markers.values()) {
+        marker.setIcon(icon(marker.eemmData, showPrice));
+        marker.off('click', eemmFlip);
+        if (showPrice) marker.on('click', eemmFlip);
+    }
+    st.levelsDirty = true;   // las celdas también muestran el precio
+}
+
+function setHidden(st, hidden) {
+    const hide = new Set(hidden);
+    for (const [ref, marker] of st.markers) {
+        const show = !hide.has(ref);
+        if (show !== st.layer.hasLayer(marker)) {
+            if (show) st.layer.addLayer(marker); else st.layer.removeLayer(marker);
+        }
+    }
+}
+
+function setPyramid(st, levels, detailZoom) {
+    st.groups.forEach((g) => st.map.removeLayer(g));
+    st.levels = levels;
+    st.detailZoom = detailZoom;
+    st.groups = levels.map((level) => {
+        const group = L.layerGroup();
+        for (const d of level[1]) {
+            const bounds = [[d[6], d[7]], [d[8], d[9]]];
+            const zoomIn = (e) => { st.map.fitBounds(bounds); L.DomEvent.stopPropagation(e); };
+            L.rectangle(bounds, { color: '#3a86ff', weight: 1, opacity: 0.5, fillOpacity: 0.08 }).on('click', zoomIn).addTo(group);
+            L.marker([d[0], d[1]], { icon: L.divIcon({ className: 'empty', html: eemmCellHtml(d, st.showPrice), iconSize: null }) })
+                .bindTooltip(eemmCellTip(d), { direction: 'top' }).on('click', zoomIn).addTo(group);
+        }
+        return group;
+    });
+    st.levelsDirty = false;
+}
+
+function setSubject(st, subject) {
+    st.subject.forEach((l) => st.map.removeLayer(l));
+    st.subject = [];
+    if (!subject) return;
+    const [lat, lon, radius] = subject;
+    if (radius) st.subject.push(L.circle([lat, lon], { radius, color: '#ff9f1c', weight: 1.5, fill: true, fillOpacity: 0.06 }).addTo(st.map));
+    st.subject.push(L.circleMarker([lat, lon], { radius: 6, color: 'white', weight: 2, fill: true, fillColor: '#ff9f1c', fillOpacity: 1 }).addTo(st.map));
+}
+
+function fitVisible(st, force) {
+    const pts = [];
+    st.layer.eachLayer((m) => pts.push(m.getLatLng()));
+    if (!pts.length) return;
+    const bounds = L.latLngBounds(pts);
+    // Se conserva el encuadre del usuario salvo que no quede ningún marcador a la vista
+    if (force || !st.map.getBounds().intersects(bounds)) st.map.fitBounds(bounds);
+}
+
+function apply(component) {
+    const { data, parentElement, setTriggerValue } = component;
+    let st = parentElement.__liveMap;
+    const first = !st;
+    if (first) st = parentElement.__liveMap = init(parentElement);
+    if (st.el.style.height !== data.height + 'px') {
+        st.el.style.height = data.height + 'px';
+        st.map.invalidateSize();
+    }
+
+    // Bloque omitido (misma huella que el último envío) que este navegador no tiene: pedir reenvío
+    for (const name of ['records', 'pyramid']) {
+        if (data[name] === null && st.digests[name] !== data.digests[name]) {
+            setTriggerValue('resync', name);
+            return;
+        }
+    }
+
+    setTiles(st, data.tiles);
+    setPrice(st, data.showPrice);
+    const newRecords = data.records !== null;
+    if (newRecords) {
+        setRecords(st, data.records);
+        st.digests.records = data.digests.records;
+    }
+    setHidden(st, data.hidden);
+    if (data.pyramid !== null || st.levelsDirty || st.detailZoom !== data.detailZoom) {
+        setPyramid(st, data.pyramid !== null ? data.pyramid : st.levels, data.detailZoom);
+        st.digests.pyramid = data.digests.pyramid;
+    }
+    setSubject(st, data.subject);
+    if (newRecords) fitVisible(st, first);
+    st.sync();
+}
+
+export default function(component) {
+    if (L) apply(component);
+    else loadLeaflet().then(() => apply(component));
+}
+""" % {'cdn': LEAFLET_CDN, 'marker_js': MARKER_JS, 'cell_js': CELL_JS}
+
+# components.v2 (carga sin build, comunicación bidireccional) sólo existe en Streamlit recientes
+try:
+    _live_map = st.components.v2.component("eemm_live_map", css=_CSS, js=_JS)
+    LIVE_MAP_AVAILABLE = True
+except AttributeError:
+    _live_map = None
+    LIVE_MAP_AVAILABLE = False
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, separators=(',', ':')).encode('utf-8')).hexdigest()[:16]
+
+
+def live_map(records, hidden=(), show_price=True, tiles=(), subject=None, pyramid=None, detail_zoom=None, height=600, key="live_map"):
+    """Mapa con estado en el navegador; cada rerun envía sólo lo que ha cambiado.
+
+    ``records`` son los marcadores de todas las promociones filtradas (eemm.markers);
+    ``hidden`` las REF que no se muestran, ``tiles`` las capas de eemm.tiles.tile_layers,
+    ``subject`` el origen de comparables ``(lat, lon, radio)`` y ``pyramid`` los niveles
+    de eemm.pyramid.pyramid_levels.
+    """
+    blobs = {'records': records, 'pyramid': pyramid or []}
+    digests = {name: _digest(value) for name, value in blobs.items()}
+    sent = st.session_state.setdefault(f"{key}__sent", {})
+    payload = {name: None if sent.get(name) == digests[name] else value for name, value in blobs.items()}
+    sent.update(digests)
+
+    result = _live_map(
+        data=dict(payload, digests=digests, hidden=sorted(str(r) for r in hidden), showPrice=bool(show_price),
+                  tiles={'key': _digest(list(tiles)), 'layers': list(tiles)},
+                  subject=list(subject) if subject else None, detailZoom=detail_zoom, height=height),
+        key=key, height=height, on_resync_change=lambda: None,
+    )
+    if result is not None and result.resync:
+        # El navegador perdió su copia: el siguiente rerun manda los bloques completos
+        sent.clear()
+        st.rerun()